@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Requisições para o Agente de Resumo
+Escrita e leitura em streaming do arquivo .agent_request.json
+(opcionalmente comprimido: .agent_request.json.gz / .zst)
+"""
+
+import json
+import codecs
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from storage import open_binary, open_text
+
+FORMAT = "agent_request/stream-v1"
+CONTENT_PREFIX = '"content": "'
+TRAILER = '"}\n'
+BLOCK_SIZE = 64 * 1024
+
+
+def write_agent_request(request_file: str,
+                        header: Dict[str, Any],
+                        content_lines: Iterable[str]) -> int:
+    """
+    Grava a requisição incrementalmente, com memória limitada
+
+    O arquivo continua sendo um JSON válido: a primeira linha traz os
+    metadados e a segunda o campo "content", escrito em blocos à medida
+    que as linhas são geradas.
+
+    Args:
+        request_file: Caminho do arquivo de saída (a compressão segue o
+            sufixo: .gz ou .zst)
+        header: Campos da requisição exceto "content"
+        content_lines: Linhas do conteúdo, sem "\\n"
+
+    Returns:
+        Número de caracteres do conteúdo
+    """
+    header = dict(header, format=FORMAT)
+    length = 0
+
+    with open_text(request_file, 'w') as f:
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ',\n')
+        f.write(CONTENT_PREFIX)
+
+        block = []
+        block_size = 0
+        first = True
+        for line in content_lines:
+            if not first:
+                block.append('\n')
+                block_size += 1
+            first = False
+            block.append(line)
+            block_size += len(line)
+            if block_size >= BLOCK_SIZE:
+                text = ''.join(block)
+                f.write(json.dumps(text, ensure_ascii=False)[1:-1])
+                length += len(text)
+                block = []
+                block_size = 0
+
+        text = ''.join(block)
+        f.write(json.dumps(text, ensure_ascii=False)[1:-1])
+        length += len(text)
+        f.write(TRAILER)
+
+    return length
+
+
+def _safe_cut(escaped: str) -> int:
+    """Posição de corte que não divide uma sequência de escape JSON"""
+    index = escaped.rfind('\\', max(0, len(escaped) - 6))
+    if index < 0:
+        return len(escaped)
+
+    start = index
+    while start > 0 and escaped[start - 1] == '\\':
+        start -= 1
+    if (index - start + 1) % 2 == 0:
+        # Termina em "\\\\": escape completo
+        return len(escaped)
+
+    needed = 6 if escaped[index + 1:index + 2] == 'u' else 2
+    return len(escaped) if index + needed <= len(escaped) else index
+
+
+def read_header(request_file: str) -> Optional[Dict[str, Any]]:
+    """
+    Lê apenas o cabeçalho de uma requisição no formato em streaming
+
+    Returns:
+        Cabeçalho (sem "content") ou None se o arquivo não existir ou
+        estiver no formato antigo
+    """
+    try:
+        with open_binary(request_file) as f:
+            first_line = f.readline().decode('utf-8').rstrip()
+    except (OSError, EOFError, UnicodeDecodeError):
+        return None
+    if not first_line.endswith(','):
+        return None
+    try:
+        header = json.loads(first_line[:-1] + '}')
+    except json.JSONDecodeError:
+        return None
+    return header if header.get("format") == FORMAT else None
+
+
+class AgentRequestReader:
+    """
+    Lê uma requisição sem materializar o conteúdo inteiro
+
+    O arquivo é lido sequencialmente, então arquivos comprimidos são
+    descomprimidos sob demanda. Arquivos no formato antigo (JSON indentado
+    gerado por json.dump) também são aceitos, mas nesse caso o conteúdo é
+    carregado de uma vez.
+    """
+
+    def __init__(self, request_file: str):
+        self.request_file = request_file
+        self._legacy_content = None
+
+        header = read_header(request_file)
+        if header is not None:
+            self.header = header
+            return
+
+        with open_text(request_file) as f:
+            data = json.load(f)
+        self._legacy_content = data.pop("content", "")
+        self.header = data
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.header.get("metadata", {})
+
+    def iter_content(self, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+        """Gera o conteúdo em blocos de texto já decodificados"""
+        if self._legacy_content is not None:
+            for start in range(0, len(self._legacy_content), block_size):
+                yield self._legacy_content[start:start + block_size]
+            return
+
+        prefix = CONTENT_PREFIX.encode('utf-8')
+        trailer = TRAILER.encode('utf-8')
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        carry = ''
+        held = b''
+
+        with open_binary(self.request_file) as f:
+            f.readline()
+            if f.read(len(prefix)) != prefix:
+                raise ValueError(f"Requisição malformada: {self.request_file}")
+
+            # Os últimos bytes lidos ficam retidos até o fim do arquivo,
+            # onde devem ser exatamente o TRAILER
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                data = held + block
+                held = data[-len(trailer):]
+                escaped = carry + decoder.decode(data[:-len(trailer)])
+                cut = _safe_cut(escaped)
+                carry = escaped[cut:]
+                if cut:
+                    yield json.loads('"' + escaped[:cut] + '"')
+
+        if held != trailer:
+            raise ValueError(f"Requisição incompleta: {self.request_file}")
+        escaped = carry + decoder.decode(b'', final=True)
+        if escaped:
+            yield json.loads('"' + escaped + '"')
+
+    def iter_lines(self) -> Iterator[str]:
+        """Gera o conteúdo linha a linha (sem "\\n")"""
+        pending = ''
+        for block in self.iter_content():
+            lines = (pending + block).split('\n')
+            pending = lines.pop()
+            yield from lines
+        yield pending
+
+
+def read_agent_request(request_file: str) -> Dict[str, Any]:
+    """Carrega a requisição inteira (conteúdo incluído) em um dicionário"""
+    reader = AgentRequestReader(request_file)
+    return dict(reader.header, content=''.join(reader.iter_content()))
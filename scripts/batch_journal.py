@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Diário de Lotes
+Registro write-ahead (JSON lines) do progresso de batch_process, para
+retomar um lote interrompido sem reler nem reprocessar o que já terminou
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+CONVERTING = "converting"
+DONE = "done"
+FAILED = "failed"
+
+
+class BatchJournal:
+    """
+    Diário de um lote, um por diretório de entrada
+
+    A primeira linha descreve o lote (lista de arquivos); as seguintes
+    registram cada mudança de estado de um arquivo, e a última marca o lote
+    como concluído. Cada linha é gravada com fsync antes de a etapa
+    correspondente começar, então após um crash o estado mais recente de
+    cada arquivo é confiável; uma última linha truncada é ignorada.
+
+    Só um processo por vez usa o diário: acquire() obtém um lock exclusivo
+    (arquivo .lock ao lado, já que start() substitui o próprio diário),
+    mantido até close().
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path).expanduser()
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self.header: Optional[Dict[str, Any]] = None
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.complete = False
+        self._file = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_directory(cls, journal_dir: str, input_dir: str) -> "BatchJournal":
+        """Diário do lote de um diretório de entrada"""
+        key = hashlib.sha1(os.path.abspath(input_dir).encode('utf-8')).hexdigest()[:16]
+        return cls(os.path.join(os.path.expanduser(journal_dir), f"{key}.jsonl"))
+
+    def acquire(self) -> bool:
+        """
+        Reserva o diário para este processo, sem bloquear
+
+        Returns:
+            False se outro processo está com um lote deste diretório em
+            andamento. Com o lock obtido, o diário é relido.
+        """
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._load()
+        return True
+
+    def _load(self):
+        self.clear()
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Diário truncado, ignorando o final: {self.path}")
+                    break
+                event = record.get("event")
+                if event == "batch":
+                    self.header = record
+                    self.entries = {}
+                    self.complete = False
+                elif event == "complete":
+                    self.complete = True
+                elif "path" in record:
+                    self.entries[record["path"]] = record
+
+    @property
+    def files(self) -> List[str]:
+        return list(self.header["files"]) if self.header else []
+
+    @property
+    def resumable(self) -> bool:
+        """Há um lote interrompido com arquivos ainda não concluídos"""
+        return self.header is not None and not self.complete
+
+    def state(self, path: str) -> str:
+        return self.entries.get(path, {}).get("state", QUEUED)
+
+    def with_state(self, *states: str) -> List[str]:
+        """Arquivos do lote nos estados indicados, na ordem do lote"""
+        return [path for path in self.files if self.state(path) in states]
+
+    def clear(self):
+        """Esquece o lote anterior (o próximo start() começa do zero)"""
+        self.header = None
+        self.entries = {}
+        self.complete = False
+
+    def start(self, input_dir: str, category: str, files: List[str]):
+        """
+        Inicia (ou retoma) o lote com a lista de arquivos
+
+        O diário é reescrito de forma atômica só com o cabeçalho e o estado
+        atual dos arquivos da lista, o que também o compacta.
+        """
+        header = {
+            "event": "batch",
+            "input_dir": os.path.abspath(input_dir),
+            "category": category,
+            "started_at": datetime.now().isoformat(),
+            "files": files,
+        }
+        entries = {path: self.entries[path] for path in files if path in self.entries}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for entry in entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self.header = header
+        self.entries = entries
+        self.complete = False
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, path: str, state: str, **fields: Any):
+        """Registra o novo estado de um arquivo (durável ao retornar)"""
+        entry = {"path": path, "state": state, "at": datetime.now().isoformat(), **fields}
+        with self._lock:
+            # Campos do estado anterior (hash, erro) não valem para o novo
+            self.entries[path] = entry
+            self._append(entry)
+
+    def finish(self):
+        """Marca o lote como concluído e fecha o diário"""
+        with self._lock:
+            self._append({"event": "complete", "at": datetime.now().isoformat()})
+            self.complete = True
+            self.close()
+
+    def _append(self, record: Dict[str, Any]):
+        if self._file is None:
+            raise RuntimeError("Diário não iniciado: chame start() antes")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """Fecha o diário e libera o lock de acquire()"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            # No flock, fechar o arquivo já libera o lock
+            if not fcntl:
+                self._lock_file.seek(0)
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._lock_file.close()
+            self._lock_file = None
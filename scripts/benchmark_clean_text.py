@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark da Limpeza de Texto
+Compara o clean_text em streaming com a implementação original
+"""
+
+import re
+import time
+import random
+import tracemalloc
+from typing import Callable, Tuple
+
+from text_cleaner import clean_text
+
+
+def clean_text_original(text: str) -> str:
+    """Implementação original de KindleProcessor.clean_text (referência)"""
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
+
+    lines = text.split('\n')
+    cleaned_lines = []
+
+    for i, line in enumerate(lines):
+        if re.match(r'^\s*\d+\s*$', line):
+            continue
+        if len(line.strip()) < 5 and i > 0 and i < len(lines)-1:
+            if lines[i-1].strip() == line.strip():
+                continue
+        cleaned_lines.append(line)
+
+    return '\n'.join(cleaned_lines)
+
+
+def gerar_livro(tamanho: int, seed: int = 42) -> str:
+    """Gera texto parecido com a saída do Calibre, com ruído típico"""
+    rng = random.Random(seed)
+    palavras = (
+        "o segundo cérebro organiza ideias projetos áreas recursos arquivos "
+        "notas capturar destilar expressar conhecimento prática método"
+    ).split()
+    partes = []
+    total = 0
+    pagina = 1
+
+    while total < tamanho:
+        frase = ' '.join(rng.choice(palavras) for _ in range(rng.randint(8, 30)))
+        escolha = rng.random()
+        if escolha < 0.05:
+            bloco = f"\n\n{pagina}\n\n\n"
+            pagina += 1
+        elif escolha < 0.08:
+            bloco = "\n***\n***\n"
+        elif escolha < 0.10:
+            bloco = f"\tCapítulo {pagina}  \x0c\n\n\n\n"
+        elif escolha < 0.12:
+            bloco = f"{frase}\r\n \x01 {frase}\n"
+        else:
+            bloco = frase.capitalize() + ".  " + frase + ".\n\n"
+        partes.append(bloco)
+        total += len(bloco)
+
+    return ''.join(partes)
+
+
+def verificar_equivalencia(casos: int = 3000, seed: int = 7) -> None:
+    """Compara as duas implementações em textos aleatórios curtos"""
+    rng = random.Random(seed)
+    alfabeto = ['\n', '\n', '\n', ' ', ' ', '\t', '\r', '\x01', '\x0b', '1', '23',
+                'ab', 'abcdef', ' 7 ', ' ', ' ', 'xx']
+    for _ in range(casos):
+        texto = ''.join(rng.choice(alfabeto) for _ in range(rng.randint(0, 25)))
+        esperado = clean_text_original(texto)
+        obtido = clean_text(texto)
+        if esperado != obtido:
+            raise AssertionError(f"Saída diferente para {texto!r}: {esperado!r} != {obtido!r}")
+
+
+def medir(funcao: Callable[[str], str], texto: str) -> Tuple[float, int, str]:
+    """Retorna (segundos, pico de memória em bytes, resultado)"""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcao(texto)
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracao, pico, resultado
+
+
+def main():
+    """Executa o benchmark"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark de clean_text")
+    parser.add_argument(
+        '-s', '--size-mb',
+        type=float,
+        default=5.0,
+        help='Tamanho do texto sintético em MB'
+    )
+    args = parser.parse_args()
+
+    print("🔎 Verificando equivalência com a implementação original...")
+    verificar_equivalencia()
+
+    texto = gerar_livro(int(args.size_mb * 1024 * 1024))
+    print(f"📖 Texto sintético: {len(texto):,} caracteres\n")
+
+    # Tempo medido sem tracemalloc, memória medida em uma segunda execução
+    resultados = {}
+    for nome, funcao in [("original", clean_text_original), ("streaming", clean_text)]:
+        inicio = time.perf_counter()
+        saida = funcao(texto)
+        duracao = time.perf_counter() - inicio
+        _, pico, _ = medir(funcao, texto)
+        resultados[nome] = (duracao, pico, saida)
+        print(f"   {nome:<10} {duracao:8.3f}s   pico {pico / 1024 / 1024:8.1f} MB")
+
+    if resultados["original"][2] != resultados["streaming"][2]:
+        raise AssertionError("Saídas diferentes no texto sintético")
+
+    ganho = resultados["original"][0] / resultados["streaming"][0]
+    memoria = resultados["original"][1] / max(1, resultados["streaming"][1])
+    print(f"\n✅ Saídas idênticas — {ganho:.1f}x mais rápido, {memoria:.1f}x menos memória de pico")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Inicialização do Processador
+Mede o tempo total de uma execução do kindle_processor.py que termina no
+cache e os módulos mais caros de importar (python -X importtime)
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import List, Tuple
+
+SCRIPT = Path(__file__).parent / "kindle_processor.py"
+TARGET_MS = 100
+
+
+def medir_execucoes(comando: List[str], repeticoes: int) -> List[float]:
+    """Executa o comando várias vezes e retorna os tempos em milissegundos"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def importacoes_mais_caras(comando: List[str], limite: int) -> List[Tuple[int, str]]:
+    """
+    Roda o comando com -X importtime
+
+    Returns:
+        Lista de (microssegundos acumulados, módulo) dos imports de nível
+        mais alto, do mais caro ao mais barato
+    """
+    resultado = subprocess.run(
+        [comando[0], "-X", "importtime"] + comando[1:],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    custos = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, acumulado, modulo = linha.split("|", 2)
+        if modulo.startswith(" ") and not modulo.startswith("  ") and acumulado.strip().isdigit():
+            custos.append((int(acumulado), modulo.strip()))
+    return sorted(custos, reverse=True)[:limite]
+
+
+def main():
+    """Executa o benchmark"""
+    parser = argparse.ArgumentParser(
+        description="Mede a inicialização do kindle_processor.py em um cache hit"
+    )
+    parser.add_argument(
+        "arquivo",
+        help="Livro já processado (a execução deve terminar no cache)"
+    )
+    parser.add_argument(
+        "--config",
+        help="Arquivo de configuração repassado ao processador"
+    )
+    parser.add_argument(
+        "-n", "--repeticoes",
+        type=int,
+        default=10,
+        help="Número de execuções medidas"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="Quantidade de módulos listados no -X importtime"
+    )
+    args = parser.parse_args()
+
+    comando = [sys.executable, str(SCRIPT), args.arquivo]
+    if args.config:
+        comando += ["--config", args.config]
+
+    # Uma execução de aquecimento (cache do sistema de arquivos e .pyc)
+    medir_execucoes(comando, 1)
+    base = statistics.median(medir_execucoes([sys.executable, "-c", "pass"], args.repeticoes))
+    tempos = medir_execucoes(comando, args.repeticoes)
+    mediana = statistics.median(tempos)
+
+    print(f"🐍 Interpretador vazio:      {base:7.1f} ms")
+    print(f"⏱️  Cache hit (mediana):      {mediana:7.1f} ms  (mín {min(tempos):.1f}, máx {max(tempos):.1f})")
+    print(f"   Custo do processador:     {mediana - base:7.1f} ms\n")
+
+    print(f"📦 Importações mais caras (-X importtime):")
+    for microssegundos, modulo in importacoes_mais_caras(comando, args.top):
+        print(f"   {microssegundos / 1000:7.1f} ms  {modulo}")
+
+    status = "✅" if mediana < TARGET_MS else "⚠️"
+    print(f"\n{status} Meta: {TARGET_MS} ms por execução com cache hit")
+    if os.environ.get("PYTHONDONTWRITEBYTECODE"):
+        print("   (PYTHONDONTWRITEBYTECODE está ativo: sem .pyc, a importação fica mais lenta)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Suíte de Benchmarks do Processamento de Texto
+Gera transcrições sintéticas realistas (marcadores "## Página N", partes,
+capítulos, citações e listas) e mede vazão (MB/s, linhas/s) e pico de
+memória de cada etapa, com saída em JSON para comparar versões
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from text_cleaner import clean_text
+from formatar_transcricoes import TranscricaoFormatter
+from formatar_transcricoes_v2 import TranscricaoFormatterV2
+from consolidar_livro import ConsolidadorLivro
+
+DEFAULT_SIZES = ["10KB", "1MB", "10MB"]
+UNITS = {"KB": 1024, "MB": 1024 * 1024, "GB": 1024 * 1024 * 1024}
+REGRESSION_THRESHOLD = 0.10
+
+PALAVRAS = (
+    "o a de que ideias projetos áreas recursos arquivos notas capturar "
+    "organizar destilar expressar conhecimento prática método segundo "
+    "cérebro memória atenção criatividade trabalho informação digital "
+    "sistema hábito resultado processo pessoas tempo livro leitura"
+).split()
+ORDINAIS = ["UM", "DOIS", "TRÊS", "QUATRO", "CINCO", "SEIS", "SETE", "OITO"]
+AUTORES = ["Peter Drucker", "Maya Angelou", "Tiago Forte", "Cal Newport", "Anônimo"]
+
+
+def parse_size(valor: str) -> int:
+    """Converte "10KB", "1.5MB" ou "2048" em bytes"""
+    texto = valor.strip().upper()
+    for unidade, fator in UNITS.items():
+        if texto.endswith(unidade):
+            return int(float(texto[:-len(unidade)]) * fator)
+    return int(texto)
+
+
+def formatar_tamanho(tamanho: int) -> str:
+    """Formata bytes como KB/MB para as tabelas"""
+    if tamanho >= UNITS["MB"]:
+        return f"{tamanho / UNITS['MB']:.1f}MB"
+    return f"{tamanho / UNITS['KB']:.0f}KB"
+
+
+def _frase(rng: random.Random, minimo: int = 8, maximo: int = 24) -> str:
+    return ' '.join(rng.choice(PALAVRAS) for _ in range(rng.randint(minimo, maximo))).capitalize()
+
+
+def gerar_transcricao(tamanho: int, seed: int = 42) -> str:
+    """
+    Gera uma transcrição sintética no formato das transcrições reais
+
+    Cabeçalho "# Transcrição", páginas separadas por "## Página N" e "---",
+    títulos de PARTE/Capítulo, seções em maiúsculas, parágrafos quebrados
+    em várias linhas, citações com autor, listas e números de página soltos.
+    """
+    rng = random.Random(seed)
+    partes = [
+        "# Transcrição: Livro Sintético - Páginas 1-9999\n\n",
+        "## Página 1\n\n\nSUMÁRIO\n\n",
+    ]
+    partes.extend(f"{numero} {_frase(rng, 2, 5)}\n" for numero in range(1, 13))
+    partes.append("\n---\n\n")
+    total = sum(len(parte) for parte in partes)
+    pagina = 2
+    parte = 0
+    capitulo = 0
+
+    while total < tamanho:
+        blocos = [f"## Página {pagina}\n\n\n"]
+        escolha = rng.random()
+        if escolha < 0.02 and parte < len(ORDINAIS):
+            blocos.append(f"PARTE {ORDINAIS[parte]}\n\n{_frase(rng, 2, 4).upper()}\n\n")
+            parte += 1
+        elif escolha < 0.10:
+            capitulo += 1
+            blocos.append(f"Capítulo {capitulo}\n\n{_frase(rng, 2, 6)}\n\n")
+
+        for _ in range(rng.randint(3, 7)):
+            tipo = rng.random()
+            if tipo < 0.08:
+                blocos.append(f"{_frase(rng, 2, 4).upper()}\n\n")
+            elif tipo < 0.16:
+                blocos.append(f"“{_frase(rng, 10, 30)}.”\n– {rng.choice(AUTORES)}\n\n")
+            elif tipo < 0.24:
+                marcador = rng.choice(["numerada", "•", "-"])
+                for item in range(1, rng.randint(3, 6)):
+                    prefixo = f"{item}." if marcador == "numerada" else marcador
+                    blocos.append(f"{prefixo} {_frase(rng, 4, 12)}.\n")
+                blocos.append("\n")
+            else:
+                # Parágrafo quebrado em linhas, como sai da transcrição das páginas
+                linhas = [_frase(rng, 8, 14) for _ in range(rng.randint(2, 6))]
+                blocos.append('\n'.join(linhas) + ".\n\n")
+
+        if rng.random() < 0.3:
+            blocos.append(f"{pagina}\n\n")
+        blocos.append("---\n\n")
+        bloco = ''.join(blocos)
+        partes.append(bloco)
+        total += len(bloco)
+        pagina += 1
+
+    return ''.join(partes)
+
+
+def _etapa_clean_text(texto: str, caminho: str) -> Any:
+    return clean_text(texto)
+
+
+def _etapa_formatter_v2(texto: str, caminho: str) -> Any:
+    return TranscricaoFormatterV2().processar_paginas(texto.splitlines(keepends=True))
+
+
+def _etapa_formatter(texto: str, caminho: str) -> Any:
+    # processar_arquivo lê e escreve arquivos: o I/O faz parte da etapa
+    with contextlib.redirect_stdout(io.StringIO()):
+        TranscricaoFormatter().processar_arquivo(caminho, caminho + ".formatado.md")
+
+
+def _etapa_consolidador(texto: str, caminho: str) -> Any:
+    consolidador = ConsolidadorLivro()
+    consolidador._extrair_estrutura(texto)
+    return consolidador.conteudo_consolidado
+
+
+STAGES: Dict[str, Callable[[str, str], Any]] = {
+    "clean_text": _etapa_clean_text,
+    "formatter_v2.processar_paginas": _etapa_formatter_v2,
+    "formatter.processar_arquivo": _etapa_formatter,
+    "consolidador._extrair_estrutura": _etapa_consolidador,
+}
+
+
+def medir_etapa(funcao: Callable[[str, str], Any],
+                texto: str,
+                caminho: str,
+                repeticoes: int,
+                memoria: bool) -> Tuple[float, Optional[int]]:
+    """
+    Retorna (melhor tempo em segundos, pico de memória em bytes)
+
+    O tempo é medido sem tracemalloc; a memória, em uma execução extra.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(texto, caminho)
+        tempos.append(time.perf_counter() - inicio)
+
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        funcao(texto, caminho)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(tempos), pico
+
+
+def executar(tamanhos: List[int],
+             etapas: List[str],
+             repeticoes: int = 3,
+             memoria: bool = True,
+             seed: int = 42) -> List[Dict[str, Any]]:
+    """Roda todas as etapas para cada tamanho de corpus"""
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_suite_") as diretorio:
+        for tamanho in tamanhos:
+            texto = gerar_transcricao(tamanho, seed)
+            dados = texto.encode('utf-8')
+            linhas = texto.count('\n') + 1
+            caminho = os.path.join(diretorio, f"transcricao_{tamanho}.md")
+            with open(caminho, 'wb') as f:
+                f.write(dados)
+
+            print(f"📖 Corpus {formatar_tamanho(len(dados))}: {linhas:,} linhas")
+            for nome in etapas:
+                duracao, pico = medir_etapa(STAGES[nome], texto, caminho, repeticoes, memoria)
+                resultado = {
+                    "stage": nome,
+                    "size_bytes": len(dados),
+                    "lines": linhas,
+                    "seconds": round(duracao, 6),
+                    "mb_per_s": round(len(dados) / UNITS["MB"] / duracao, 3) if duracao else None,
+                    "lines_per_s": round(linhas / duracao) if duracao else None,
+                    "peak_memory_bytes": pico,
+                }
+                resultados.append(resultado)
+                memoria_texto = f"pico {pico / UNITS['MB']:8.1f} MB" if pico is not None else ""
+                print(f"   {nome:<34} {duracao:8.3f}s  {resultado['mb_per_s'] or 0:8.2f} MB/s  "
+                      f"{resultado['lines_per_s'] or 0:>10,} linhas/s  {memoria_texto}")
+            print()
+    return resultados
+
+
+def metadados() -> Dict[str, Any]:
+    """Ambiente da execução, para comparar resultados entre versões"""
+    commit = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def comparar(resultados: List[Dict[str, Any]],
+             arquivo_base: str,
+             limite: float = REGRESSION_THRESHOLD) -> int:
+    """
+    Compara a vazão com um JSON anterior desta suíte
+
+    Returns:
+        Número de regressões acima do limite (fração da vazão anterior)
+    """
+    with open(arquivo_base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    anteriores = {(r["stage"], r["size_bytes"]): r for r in base.get("results", [])}
+
+    print(f"📊 Comparação com {arquivo_base} (commit {base.get('metadata', {}).get('commit')}):")
+    regressoes = 0
+    for resultado in resultados:
+        anterior = anteriores.get((resultado["stage"], resultado["size_bytes"]))
+        if not anterior or not anterior.get("mb_per_s") or not resultado["mb_per_s"]:
+            continue
+        variacao = resultado["mb_per_s"] / anterior["mb_per_s"] - 1
+        if variacao < -limite:
+            status = "🔻"
+            regressoes += 1
+        elif variacao > limite:
+            status = "🔺"
+        else:
+            status = "  "
+        print(f"   {status} {resultado['stage']:<34} {formatar_tamanho(resultado['size_bytes']):>7}  "
+              f"{anterior['mb_per_s']:8.2f} → {resultado['mb_per_s']:8.2f} MB/s ({variacao:+.0%})")
+    return regressoes
+
+
+def main():
+    """Executa a suíte de benchmarks"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks das etapas de processamento de transcrições"
+    )
+    parser.add_argument(
+        '-s', '--sizes',
+        nargs='+',
+        default=DEFAULT_SIZES,
+        help='Tamanhos do corpus sintético (ex.: 10KB 1MB 50MB)'
+    )
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=list(STAGES),
+        default=list(STAGES),
+        help='Etapas medidas (padrão: todas)'
+    )
+    parser.add_argument(
+        '-n', '--repeticoes',
+        type=int,
+        default=3,
+        help='Execuções por etapa (vale o melhor tempo)'
+    )
+    parser.add_argument(
+        '--no-memory',
+        action='store_true',
+        help='Não medir pico de memória (tracemalloc deixa corpus grandes lentos)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=42,
+        help='Semente do gerador de corpus'
+    )
+    parser.add_argument(
+        '--json',
+        help='Salvar os resultados em JSON'
+    )
+    parser.add_argument(
+        '--baseline',
+        help='JSON de uma execução anterior para comparar a vazão'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help='Queda de vazão considerada regressão (padrão: 0.10 = 10%%)'
+    )
+    args = parser.parse_args()
+
+    tamanhos = [parse_size(tamanho) for tamanho in args.sizes]
+    resultados = executar(tamanhos, args.stages, args.repeticoes, not args.no_memory, args.seed)
+
+    if args.json:
+        relatorio = {
+            "metadata": metadados(),
+            "seed": args.seed,
+            "repetitions": args.repeticoes,
+            "results": resultados,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    if args.baseline:
+        regressoes = comparar(resultados, args.baseline, args.threshold)
+        if regressoes:
+            print(f"\n⚠️  {regressoes} regressão(ões) acima de {args.threshold:.0%}")
+            sys.exit(1)
+        print("\n✅ Sem regressões")
+
+
+if __name__ == "__main__":
+    main()
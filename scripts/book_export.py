@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Exportação de Arquivos de Livros
+Cópia que aproveita o sistema de arquivos (reflink, copy_file_range ou
+hard link), pula destinos idênticos à origem e calcula o fingerprint
+durante a cópia, entregando-o ao processador em um sidecar
+"""
+
+import os
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fingerprint import (
+    BUFFER_SIZE, DEFAULT_ALGORITHM, file_fingerprint, new_hasher, read_sidecar,
+    sidecar_path, stat_signature, write_sidecar
+)
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_PREFIX = ".part-"
+# ioctl FICLONE do Linux (Btrfs, XFS, bcachefs...): clona os blocos sem copiá-los
+FICLONE = 0x40049409
+COPY_CHUNK = 64 * 1024 * 1024
+
+# Métodos de exportação (o que foi feito com cada livro)
+SKIPPED = "skipped"
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+COPY_RANGE = "copy_file_range"
+COPY = "copy"
+
+# Métodos que não gravam os dados de novo no destino
+NO_DATA_METHODS = (SKIPPED, HARDLINK, REFLINK)
+
+
+def files_match(source: Path, destination: Path, algorithm: Optional[str] = DEFAULT_ALGORITHM) -> bool:
+    """
+    O destino já é uma cópia idêntica da origem?
+
+    Tamanho e mtime (preservado pela exportação) precisam bater antes
+    de comparar o fingerprint. Se o sidecar do destino ainda vale e a
+    origem não mudou desde a cópia, nenhum dos dois arquivos é relido.
+    """
+    try:
+        src = os.stat(source)
+        dst = os.stat(destination)
+    except FileNotFoundError:
+        return False
+    if (src.st_dev, src.st_ino) == (dst.st_dev, dst.st_ino):
+        return True
+    if src.st_size != dst.st_size or src.st_mtime_ns != dst.st_mtime_ns:
+        return False
+
+    if algorithm is None:
+        return file_fingerprint(str(source)) == file_fingerprint(str(destination))
+    source_record = _source_record(source)
+    sidecar = read_sidecar(str(destination), algorithm)
+    if sidecar is not None and sidecar.get("source") == source_record:
+        return True
+    digest = file_fingerprint(str(destination), algorithm)
+    if file_fingerprint(str(source), algorithm) != digest:
+        return False
+    write_sidecar(str(destination), digest, algorithm, source_record)
+    return True
+
+
+def _source_record(source: Path) -> Dict:
+    return {"path": os.path.abspath(source), **stat_signature(str(source))}
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _copy_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    # Cópia dentro do kernel (e no servidor, em NFS/SMB), sem passar
+    # os dados pelo espaço do usuário
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            sent = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+            if sent == 0:
+                break
+            copied += sent
+    except OSError:
+        if copied:
+            raise
+        return False
+    return copied == size
+
+
+def copy_file(source: Path, destination: Path, hasher=None) -> str:
+    """
+    Copia o conteúdo pelo caminho mais barato que o sistema permitir
+
+    Com hasher, o conteúdo é hasheado na mesma leitura da cópia: a cópia
+    pelo kernel (copy_file_range) é trocada pela cópia em buffer, já que a
+    origem teria de ser lida de novo só para o hash.
+
+    Returns:
+        Método usado (REFLINK, COPY_RANGE ou COPY)
+    """
+    size = os.stat(source).st_size
+    with open(source, 'rb', buffering=0) as src, open(destination, 'wb') as dst:
+        if _reflink(src.fileno(), dst.fileno()):
+            method = REFLINK
+            if hasher is None:
+                return method
+        elif hasher is None and _copy_range(src.fileno(), dst.fileno(), size):
+            return COPY_RANGE
+        else:
+            method = COPY
+            dst.seek(0)
+            dst.truncate()
+        src.seek(0)
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = src.readinto(buffer)
+            if not read:
+                break
+            if method == COPY:
+                dst.write(view[:read])
+            if hasher is not None:
+                hasher.update(view[:read])
+    return method
+
+
+def export_file(source: Path,
+                destination: Path,
+                link: bool = False,
+                algorithm: Optional[str] = DEFAULT_ALGORITHM) -> Tuple[str, int]:
+    """
+    Exporta um arquivo de livro, pulando destinos idênticos
+
+    O destino é gravado em um arquivo temporário e publicado com
+    os.replace, então nunca fica pela metade para o processador.
+
+    Args:
+        link: Tentar hard link antes de copiar (mesmo sistema de arquivos;
+            o destino passa a ser o mesmo arquivo da biblioteca do Kindle)
+        algorithm: Fingerprint gravado no sidecar do destino (None = sem
+            sidecar); o KindleProcessor usa esse hash em vez de reler o livro
+
+    Returns:
+        (método, bytes do livro)
+    """
+    source = Path(source)
+    destination = Path(destination)
+    size = os.stat(source).st_size
+    if files_match(source, destination, algorithm):
+        return SKIPPED, size
+
+    partial = destination.with_name(PARTIAL_PREFIX + destination.name)
+    partial.unlink(missing_ok=True)
+    hasher = new_hasher(algorithm) if algorithm else None
+    try:
+        method = None
+        if link:
+            try:
+                os.link(source, partial)
+                method = HARDLINK
+            except OSError as e:
+                logger.debug(f"Hard link indisponível ({e}), copiando {source}")
+            if method == HARDLINK and hasher is not None:
+                with open(partial, 'rb', buffering=0) as f:
+                    for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                        hasher.update(block)
+        if method is None:
+            method = copy_file(source, partial, hasher)
+            shutil.copystat(source, partial)
+        # O sidecar antigo descreve o destino anterior
+        Path(sidecar_path(str(destination))).unlink(missing_ok=True)
+        os.replace(partial, destination)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    if hasher is not None:
+        write_sidecar(str(destination), hasher.hexdigest(), algorithm, _source_record(source))
+    return method, size
+
+
+def summarize(results: Dict[str, Tuple[str, int]]) -> Dict[str, int]:
+    """Totais de uma exportação: livros e bytes por método"""
+    summary = {"books": len(results), "bytes_copied": 0, "bytes_skipped": 0, "bytes_linked": 0}
+    for method, size in results.values():
+        summary[method] = summary.get(method, 0) + 1
+        if method == SKIPPED:
+            summary["bytes_skipped"] += size
+        elif method in NO_DATA_METHODS:
+            summary["bytes_linked"] += size
+        else:
+            summary["bytes_copied"] += size
+    return summary
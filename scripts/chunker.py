@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Divisor de Texto em Chunks
+Quebra o texto limpo de um livro em trechos com sobreposição, respeitando
+parágrafos, frases e capítulos, sem carregar o livro inteiro em memória
+"""
+
+import re
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import open_text
+
+# Marcadores de página das transcrições ("## Página 66")
+PAGE_RE = re.compile(r'^#*\s*Página\s+(\d+)\s*$', re.IGNORECASE)
+PART_RE = re.compile(r'^#*\s*(PARTE\s+(?:UM|DOIS|TRÊS|QUATRO|CINCO|[IVX]+|\d+)\b.*)$')
+CHAPTER_RE = re.compile(r'^#*\s*((?:Capítulo|Chapter)\s+\d+\b.*)$', re.IGNORECASE)
+SEPARATOR_RE = re.compile(r'^\s*(---+|\*\*\*+)\s*$')
+SENTENCE_END_RE = re.compile(r'[.!?…]["”»)\]]*\s+')
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_CHUNK_OVERLAP = 200
+
+
+def _split_long(text: str, start: int, limit: int) -> List[Tuple[str, int]]:
+    """
+    Divide um trecho longo em pedaços de até "limit" caracteres
+
+    Corta preferencialmente em fim de frase, depois em espaço em branco
+    e, em último caso, no meio da palavra.
+
+    Returns:
+        Lista de (texto, posição inicial)
+    """
+    pieces = []
+    position = 0
+    while len(text) - position > limit:
+        window_end = position + limit
+        cut = None
+        for match in SENTENCE_END_RE.finditer(text, position, window_end):
+            cut = match.end()
+        if cut is None or cut == position:
+            space = text.rfind(' ', position + 1, window_end)
+            cut = space + 1 if space > position else window_end
+        pieces.append((text[position:cut].rstrip(), start + position))
+        position = cut
+    pieces.append((text[position:], start + position))
+    return pieces
+
+
+def iter_units(lines: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Gera unidades de texto (parágrafos ou pedaços de parágrafos)
+
+    Cada unidade traz sua posição no texto original ("\\n".join(lines))
+    e a página, capítulo e parte em que aparece.
+    """
+    offset = 0
+    page = None
+    chapter = None
+    part = None
+    buffer: List[str] = []
+    buffer_start = 0
+    buffer_length = 0
+    continuation = False
+    boundary = False
+
+    def unit(text: str, start: int, new_paragraph: bool, starts_section: bool) -> Dict[str, Any]:
+        return {
+            "text": text,
+            "start": start,
+            "end": start + len(text),
+            "page": page,
+            "chapter": chapter,
+            "part": part,
+            "new_paragraph": new_paragraph,
+            "boundary": starts_section,
+        }
+
+    def flush(final: bool = True) -> Iterator[Dict[str, Any]]:
+        nonlocal buffer, buffer_start, buffer_length, continuation, boundary
+        if not buffer:
+            return
+        text = '\n'.join(buffer)
+        pieces = _split_long(text, buffer_start, chunk_size)
+        if not final:
+            # Parágrafo muito longo: emite o que já está completo e
+            # mantém o último pedaço aberto
+            *pieces, (rest, rest_start) = pieces
+        for text_piece, piece_start in pieces:
+            if text_piece.strip():
+                yield unit(text_piece, piece_start, not continuation, boundary)
+                continuation = True
+                boundary = False
+        if final:
+            buffer, buffer_length = [], 0
+            continuation = False
+        else:
+            buffer, buffer_start, buffer_length = [rest], rest_start, len(rest)
+
+    for line in lines:
+        line_start = offset
+        offset += len(line) + 1
+        stripped = line.strip()
+
+        page_match = PAGE_RE.match(stripped)
+        if page_match:
+            yield from flush()
+            page = int(page_match.group(1))
+            continue
+
+        if not stripped or SEPARATOR_RE.match(stripped):
+            yield from flush()
+            continue
+
+        heading = PART_RE.match(stripped) or CHAPTER_RE.match(stripped)
+        if heading:
+            yield from flush()
+            if heading.re is PART_RE:
+                part = heading.group(1).strip()
+                chapter = None
+            else:
+                chapter = heading.group(1).strip()
+            boundary = True
+
+        if not buffer:
+            buffer_start = line_start
+        buffer.append(line)
+        buffer_length += len(line) + 1
+
+        if buffer_length > 4 * chunk_size:
+            yield from flush(final=False)
+
+    yield from flush()
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    """Final do texto usado como sobreposição, começando em frase ou palavra"""
+    if overlap <= 0 or not text:
+        return ''
+    tail = text[-overlap:]
+    if len(tail) < len(text):
+        sentence = SENTENCE_END_RE.search(tail)
+        if sentence and sentence.end() < len(tail):
+            return tail[sentence.end():]
+        space = tail.find(' ')
+        if space >= 0:
+            return tail[space + 1:]
+    return tail
+
+
+def iter_chunks(lines: Iterable[str],
+                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+                breaks: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Divide o texto em chunks de até "chunk_size" caracteres
+
+    Parágrafos são mantidos inteiros sempre que cabem; parágrafos longos
+    são quebrados em fim de frase. Cada chunk começa com até
+    "chunk_overlap" caracteres do final do anterior, exceto no início de
+    um capítulo ou parte, que sempre abre um chunk novo.
+
+    Args:
+        lines: Linhas do texto limpo, sem "\\n"
+        chunk_size: Tamanho máximo do chunk em caracteres
+        chunk_overlap: Sobreposição entre chunks consecutivos
+        breaks: Posições (em ordem crescente) onde um chunk deve começar;
+            o chunk começa na primeira unidade a partir de cada posição.
+            Usado na re-sumarização incremental para reproduzir os cortes
+            da versão anterior nos trechos que não mudaram
+
+    Yields:
+        Dicionários com texto, posições (start/end no texto original),
+        tamanho da sobreposição, páginas, capítulo e parte
+    """
+    chunk_overlap = max(0, min(chunk_overlap, chunk_size // 2))
+    units: List[Dict[str, Any]] = []
+    length = 0
+    overlap = 0
+    index = 0
+    pending_breaks = iter(sorted(breaks)) if breaks is not None else iter(())
+    next_break = next(pending_breaks, None)
+
+    def emit() -> Dict[str, Any]:
+        nonlocal units, length, overlap, index
+        parts = []
+        for position, item in enumerate(units):
+            if position:
+                parts.append('\n\n' if item["new_paragraph"] else ' ')
+            parts.append(item["text"])
+        body = units[1:] if overlap else units
+        pages = [item["page"] for item in body if item["page"] is not None]
+        chunk = {
+            "index": index,
+            "text": ''.join(parts),
+            "start": units[0]["start"],
+            "end": units[-1]["end"],
+            "overlap": overlap,
+            "page_start": pages[0] if pages else None,
+            "page_end": pages[-1] if pages else None,
+            "chapter": body[0]["chapter"],
+            "part": body[0]["part"],
+        }
+        index += 1
+        return chunk
+
+    for item in iter_units(lines, chunk_size):
+        size = len(item["text"])
+        joined = length + (2 if units else 0) + size
+
+        forced = False
+        while next_break is not None and item["start"] >= next_break:
+            forced = True
+            next_break = next(pending_breaks, None)
+
+        if len(units) > (1 if overlap else 0) and (item["boundary"] or forced or joined > chunk_size):
+            previous = units[-1]
+            chunk = emit()
+            yield chunk
+
+            units, length, overlap = [], 0, 0
+            if not item["boundary"]:
+                tail = _overlap_tail(previous["text"], min(chunk_overlap, chunk_size - size - 2))
+                if tail:
+                    units = [dict(previous, text=tail, start=previous["end"] - len(tail))]
+                    length = len(tail)
+                    overlap = len(tail)
+
+        units.append(item)
+        length += (2 if len(units) > 1 else 0) + size
+
+    if units and len(units) > (1 if overlap else 0):
+        yield emit()
+
+
+def write_chunks_file(chunks_file: str,
+                      header: Dict[str, Any],
+                      chunks: Iterable[Dict[str, Any]]) -> int:
+    """
+    Grava chunks em JSON Lines: uma linha de cabeçalho e uma por chunk
+    (comprimido se o nome terminar em .gz ou .zst)
+
+    Returns:
+        Número de chunks gravados
+    """
+    count = 0
+    with open_text(chunks_file, 'w') as f:
+        f.write(json.dumps(dict(header, type="book"), ensure_ascii=False) + '\n')
+        for chunk in chunks:
+            f.write(json.dumps(dict(chunk, type="chunk"), ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+class ChunkReader:
+    """
+    Iterador dos chunks de um arquivo aberto
+
+    O arquivo é fechado ao chegar ao fim ou em close(), que pode ser
+    chamado mesmo antes de a iteração começar.
+    """
+
+    def __init__(self, f):
+        self._file = f
+
+    def __iter__(self) -> "ChunkReader":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        while True:
+            line = self._file.readline()
+            if not line:
+                self.close()
+                raise StopIteration
+            if line.strip():
+                return json.loads(line)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "ChunkReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_chunks_file(chunks_file: str) -> Tuple[Dict[str, Any], ChunkReader]:
+    """
+    Lê um arquivo de chunks
+
+    Returns:
+        (cabeçalho, leitor dos chunks)
+    """
+    f = open_text(chunks_file)
+    try:
+        first = f.readline()
+        header = json.loads(first) if first.strip() else {}
+    except BaseException:
+        f.close()
+        raise
+    return header, ChunkReader(f)
+
+
+def main():
+    """Divide um arquivo de texto ou transcrição em chunks"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Divide texto de livro em chunks com sobreposição"
+    )
+    parser.add_argument(
+        'arquivo',
+        help='Arquivo de texto ou transcrição (.txt, .md)'
+    )
+    parser.add_argument(
+        '-s', '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help='Tamanho máximo do chunk em caracteres'
+    )
+    parser.add_argument(
+        '--overlap',
+        type=int,
+        default=DEFAULT_CHUNK_OVERLAP,
+        help='Sobreposição entre chunks em caracteres'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Arquivo JSONL de saída (padrão: <arquivo>.chunks.jsonl)'
+    )
+
+    args = parser.parse_args()
+
+    from text_cleaner import iter_file_lines
+
+    output = args.output or str(Path(args.arquivo).with_suffix('.chunks.jsonl'))
+    with open_text(args.arquivo, errors='ignore') as f:
+        total = write_chunks_file(
+            output,
+            {
+                "source": str(args.arquivo),
+                "chunk_size": args.chunk_size,
+                "chunk_overlap": args.overlap,
+            },
+            iter_chunks(iter_file_lines(f), args.chunk_size, args.overlap)
+        )
+
+    print(f"✅ {total} chunks salvos em: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Despachante Assíncrono de Requisições de Resumo
+Envia chunks e requisições do agente à API com limite de taxa, retries,
+backoff exponencial e fallback de modelo
+"""
+
+import os
+import ssl
+import json
+import time
+import random
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+from urllib.parse import urlsplit
+
+from storage import strip_compression
+from summary_cache import SummaryCache, text_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.anthropic.com"
+API_VERSION = "2023-06-01"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+CHUNK_PROMPT = """Você está analisando o livro "{titulo}" de {autor}.
+
+Trecho {numero}{localizacao}:
+
+<trecho>
+{texto}
+</trecho>
+
+Resuma este trecho em português, preservando as ideias principais, conceitos,
+exemplos e citações relevantes. Não invente informações que não estejam no trecho."""
+
+FULL_PROMPT = """Você está analisando o livro "{titulo}" de {autor} (categoria: {categoria}).
+
+<livro>
+{texto}
+</livro>
+
+Produza a análise completa do livro conforme suas instruções."""
+
+
+class ApiError(Exception):
+    """Erro retornado pela API de mensagens"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """Limitador de taxa: "rate_per_minute" requisições, com rajadas limitadas"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # Criado no loop em execução: no Python 3.8/3.9 um asyncio.Lock
+        # criado fora dele fica preso ao loop padrão, não ao de asyncio.run
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    async def acquire(self):
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessagesClient:
+    """Cliente HTTP mínimo e assíncrono para a API de mensagens"""
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL):
+        self.api_key = api_key
+        url = urlsplit(base_url)
+        self.scheme = url.scheme or "https"
+        self.host = url.hostname
+        self.port = url.port or (443 if self.scheme == "https" else 80)
+        self.path = url.path.rstrip("/") + "/v1/messages"
+        self._ssl = ssl.create_default_context() if self.scheme == "https" else None
+
+    async def create_message(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Envia uma requisição POST /v1/messages e retorna o JSON da resposta"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        request = (
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"x-api-key: {self.api_key}\r\n"
+            f"anthropic-version: {API_VERSION}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1") + body
+
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self._ssl,
+            server_hostname=self.host if self._ssl else None
+        )
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, headers, data = await self._read_response(reader)
+        finally:
+            writer.close()
+
+        try:
+            response = json.loads(data.decode("utf-8")) if data else {}
+        except json.JSONDecodeError:
+            response = {"error": {"message": data[:200].decode("utf-8", "replace")}}
+
+        if status >= 400:
+            retry_after = headers.get("retry-after")
+            raise ApiError(
+                status,
+                response.get("error", {}).get("message", "erro desconhecido"),
+                float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        return response
+
+    async def _read_response(self, reader: asyncio.StreamReader):
+        # Conexão fechada sem resposta ou resposta malformada: erro de
+        # conexão (OSError), para o envio tentar de novo
+        status_line = await reader.readline()
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ConnectionError(f"Resposta HTTP inválida: {status_line[:80]!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size_line = await reader.readline()
+                try:
+                    size = int(size_line.split(b";")[0], 16)
+                except ValueError:
+                    raise ConnectionError(f"Chunk HTTP inválido: {size_line[:80]!r}") from None
+                if size == 0:
+                    await reader.readline()
+                    break
+                parts.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(parts)
+        elif "content-length" in headers:
+            if not headers["content-length"].isdigit():
+                raise ConnectionError(f"Content-Length inválido: {headers['content-length'][:80]!r}")
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+        return status, headers, data
+
+
+class SummaryDispatcher:
+    """
+    Mantém várias requisições em paralelo respeitando os limites da API
+
+    Usa api_limits, model_config e processing_config de
+    configuracoes/config.json.
+    """
+
+    def __init__(self,
+                 config: Dict[str, Any],
+                 client: MessagesClient,
+                 system_prompt: Optional[str] = None,
+                 cache: Optional[SummaryCache] = None):
+        limits = config.get("api_limits", {})
+        models = config.get("model_config", {})
+        processing = config.get("processing_config", {})
+
+        self.client = client
+        self.system_prompt = system_prompt
+        self.cache = cache
+        self.bucket = TokenBucket(limits.get("rate_limit_per_minute", 50))
+        self.max_retries = limits.get("max_retries", 3)
+        self.retry_delay = limits.get("retry_delay_seconds", 2)
+        self.timeout = limits.get("timeout_seconds", 300)
+        self.models = [models.get("primary_model", "claude-3-5-sonnet-20241022")]
+        if models.get("fallback_model"):
+            self.models.append(models["fallback_model"])
+        self.temperature = models.get("temperature", 0.3)
+        self.max_tokens = models.get("max_tokens", 8192)
+        self.concurrency = (
+            processing.get("max_chunks_per_batch", 10)
+            if processing.get("parallel_processing", True) else 1
+        )
+
+    def _payload(self, model: str, prompt: str) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if self.system_prompt:
+            payload["system"] = self.system_prompt
+        return payload
+
+    def _cache_key(self, request: Dict[str, Any], model: str) -> str:
+        template = (self.system_prompt or "") + "\0" + request.get("template", "")
+        return SummaryCache.key(
+            text_hash(request["text"]),
+            text_hash(template),
+            model,
+            self.temperature
+        )
+
+    async def send(self, request: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Envia um prompt, consultando antes o cache de resumos
+
+        Args:
+            request: Prompt pronto ou dicionário com "prompt", "text"
+                (texto resumido) e "template" (identidade do prompt)
+
+        Cada resposta fica no cache sob o modelo que a produziu. O cache do
+        fallback só é consultado quando o modelo principal falha, então uma
+        queda passageira do principal não fixa o resumo do fallback.
+
+        Returns:
+            Dicionário com modelo usado, texto, uso de tokens e tentativas
+        """
+        if isinstance(request, str):
+            request = {"prompt": request, "text": request}
+
+        keys: Dict[str, str] = {}
+        if self.cache is not None:
+            keys = {model: self._cache_key(request, model) for model in self.models}
+            cached = self.cache.get(keys[self.models[0]])
+            if cached is not None:
+                return dict(cached, attempts=0, cached=True)
+
+        return await self._send(request["prompt"], keys)
+
+    async def _send(self, prompt: str, keys: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Envia um prompt com retries e fallback de modelo"""
+        keys = keys or {}
+        attempts = 0
+        last_error: Optional[Exception] = None
+
+        for model in self.models:
+            if model != self.models[0] and model in keys:
+                cached = self.cache.get(keys[model])
+                if cached is not None:
+                    return dict(cached, attempts=attempts, cached=True)
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire()
+                attempts += 1
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.create_message(self._payload(model, prompt)),
+                        self.timeout
+                    )
+                    text = ''.join(
+                        block.get("text", "")
+                        for block in response.get("content", [])
+                        if block.get("type") == "text"
+                    )
+                    result = {
+                        "status": "ok",
+                        "model": response.get("model", model),
+                        "summary": text,
+                        "usage": response.get("usage", {}),
+                        "attempts": attempts,
+                    }
+                    if model in keys:
+                        self.cache.put(keys[model], {
+                            field: result[field] for field in ("status", "model", "summary", "usage")
+                        })
+                    return result
+                except ApiError as e:
+                    last_error = e
+                    if not e.retryable:
+                        break
+                    delay = e.retry_after
+                except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError) as e:
+                    last_error = e
+                    delay = None
+
+                if attempt < self.max_retries:
+                    if delay is None:
+                        delay = self.retry_delay * (2 ** attempt) * (1 + random.random() / 4)
+                    logger.warning(f"{model}: {last_error}; nova tentativa em {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+            if model != self.models[-1]:
+                logger.warning(f"{model} falhou ({last_error}); usando fallback")
+
+        return {"status": "error", "error": str(last_error), "attempts": attempts}
+
+    async def dispatch(self, prompts: Iterable[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Envia todos os prompts, com até "concurrency" em andamento
+
+        Returns:
+            Resultados na mesma ordem dos prompts
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: Dict[int, Dict[str, Any]] = {}
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, prompt = item
+                try:
+                    results[index] = await self.send(prompt)
+                except Exception as e:
+                    # Um worker que morre deixaria a fila cheia e o dispatch preso
+                    logger.error(f"Erro inesperado no prompt {index}: {e!r}")
+                    results[index] = {"status": "error", "error": repr(e), "attempts": 0}
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        total = 0
+        for index, prompt in enumerate(prompts):
+            await queue.put((index, prompt))
+            total += 1
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+        return [dict(results[index], index=index) for index in range(total)]
+
+
+def chunk_request(header: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Monta a requisição de resumo de um chunk
+
+    A identidade do template inclui título, autor e capítulo, mas não o
+    número do chunk nem as páginas: inserir um parágrafo no início do
+    livro desloca essas posições sem mudar o texto dos chunks seguintes.
+    """
+    metadata = header.get("metadata", {})
+    template = json.dumps([
+        CHUNK_PROMPT,
+        metadata.get("title", "Unknown"),
+        metadata.get("author", "Unknown"),
+        chunk.get("chapter"),
+    ], ensure_ascii=False)
+    return {
+        "prompt": chunk_prompt(header, chunk),
+        "text": chunk["text"],
+        "template": template,
+    }
+
+
+def chunk_prompt(header: Dict[str, Any], chunk: Dict[str, Any]) -> str:
+    """Monta o prompt de resumo de um chunk"""
+    metadata = header.get("metadata", {})
+    localizacao = []
+    if chunk.get("chapter"):
+        localizacao.append(chunk["chapter"])
+    if chunk.get("page_start") is not None:
+        paginas = chunk["page_start"]
+        if chunk.get("page_end") not in (None, chunk["page_start"]):
+            paginas = f"{chunk['page_start']}-{chunk['page_end']}"
+        localizacao.append(f"páginas {paginas}")
+
+    return CHUNK_PROMPT.format(
+        titulo=metadata.get("title", "Unknown"),
+        autor=metadata.get("author", "Unknown"),
+        numero=chunk["index"] + 1,
+        localizacao=f" ({', '.join(localizacao)})" if localizacao else "",
+        texto=chunk["text"]
+    )
+
+
+def load_prompts(input_file: str):
+    """
+    Lê prompts de um arquivo de chunks (.chunks.jsonl) ou de uma
+    requisição do agente (.agent_request.json)
+
+    Returns:
+        (cabeçalho, gerador de requisições)
+    """
+    if strip_compression(input_file).endswith(".jsonl"):
+        from chunker import read_chunks_file
+
+        header, chunks = read_chunks_file(input_file)
+        return header, (chunk_request(header, chunk) for chunk in chunks)
+
+    from agent_request import AgentRequestReader
+
+    reader = AgentRequestReader(input_file)
+    metadata = reader.metadata
+    fields = {
+        "titulo": metadata.get("title", "Unknown"),
+        "autor": metadata.get("author", "Unknown"),
+        "categoria": metadata.get("category", "general"),
+    }
+    text = ''.join(reader.iter_content())
+    request = {
+        "prompt": FULL_PROMPT.format(texto=text, **fields),
+        "text": text,
+        "template": json.dumps([FULL_PROMPT, fields], ensure_ascii=False),
+    }
+    return reader.header, iter([request])
+
+
+def main():
+    """Interface de linha de comando"""
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Envia chunks/requisições do agente para a API de resumo"
+    )
+    parser.add_argument(
+        "input",
+        help="Arquivo .chunks.jsonl ou .agent_request.json"
+    )
+    parser.add_argument(
+        "--config",
+        default=str(Path(__file__).parent.parent / "configuracoes" / "config.json"),
+        help="Arquivo de configuração do agente"
+    )
+    parser.add_argument(
+        "--system-prompt",
+        default=str(Path(__file__).parent.parent / "prompts" / "system_prompt.md"),
+        help="Arquivo com o system prompt"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=os.environ.get("ANTHROPIC_BASE_URL", DEFAULT_BASE_URL),
+        help="URL base da API (útil para testes com servidor local)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Arquivo JSONL de resultados (padrão: <input>.summaries.jsonl)"
+    )
+    parser.add_argument(
+        "--cache",
+        help="Banco SQLite do cache de resumos (padrão: processing_config.cache_path)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignora o cache de resumos"
+    )
+
+    args = parser.parse_args()
+
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        parser.error("Defina a variável de ambiente ANTHROPIC_API_KEY")
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    system_prompt = None
+    if args.system_prompt and Path(args.system_prompt).exists():
+        system_prompt = Path(args.system_prompt).read_text(encoding='utf-8')
+
+    cache = None if args.no_cache else SummaryCache.from_config(config, args.cache)
+    dispatcher = SummaryDispatcher(
+        config, MessagesClient(api_key, args.base_url), system_prompt, cache
+    )
+    header, prompts = load_prompts(args.input)
+    try:
+        results = asyncio.run(dispatcher.dispatch(prompts))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    output = args.output or str(Path(strip_compression(args.input)).with_suffix('.summaries.jsonl'))
+    with open(output, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    failed = sum(1 for result in results if result["status"] != "ok")
+    print(f"\n✅ {len(results) - failed} resumos gerados, {failed} falhas")
+    if cache is not None:
+        print(f"💾 Cache: {cache.hits} reaproveitados, {cache.misses} enviados à API")
+    print(f"📁 Resultados salvos em: {output}")
+
+
+if __name__ == "__main__":
+    main()
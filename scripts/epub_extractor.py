@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Extrator Nativo de EPUB
+Lê metadados (OPF) e texto (spine XHTML) direto do container zip, sem Calibre
+"""
+
+import io
+import re
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import unquote
+
+from storage import open_text
+
+NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "enc": "http://www.w3.org/2001/04/xmlenc#",
+}
+
+# Algoritmos de ofuscação de fontes não são DRM: o texto continua legível
+FONT_OBFUSCATION = {
+    "http://www.idpf.org/2008/embedding",
+    "http://ns.adobe.com/pdf/enc#RC",
+}
+
+BLOCK_TAGS = {
+    "p", "div", "br", "hr", "li", "ul", "ol", "tr", "table", "blockquote",
+    "section", "article", "aside", "header", "footer", "pre", "figure",
+    "figcaption", "dt", "dd", "h1", "h2", "h3", "h4", "h5", "h6",
+}
+SKIP_TAGS = {"head", "script", "style", "title"}
+READ_SIZE = 64 * 1024
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class EpubError(Exception):
+    """EPUB inválido ou protegido por DRM"""
+
+
+def parse_opf_metadata(package: ET.Element) -> Dict[str, str]:
+    """
+    Lê metadados Dublin Core de um pacote OPF
+
+    Usa as mesmas chaves da saída do ebook-meta consumidas pelo processador.
+    """
+    def texts(tag: str) -> List[str]:
+        return [
+            element.text.strip()
+            for element in package.iterfind(f"opf:metadata/dc:{tag}", NAMESPACES)
+            if element.text and element.text.strip()
+        ]
+
+    metadata = {}
+    for key, tag in [
+        ("Title", "title"),
+        ("Author(s)", "creator"),
+        ("Publisher", "publisher"),
+        ("Languages", "language"),
+        ("Published", "date"),
+        ("Identifiers", "identifier"),
+    ]:
+        values = texts(tag)
+        if values:
+            metadata[key] = " & ".join(values) if key == "Author(s)" else ", ".join(values)
+    return metadata
+
+
+class _SpineTextParser(HTMLParser):
+    """Converte XHTML em parágrafos de texto, emitidos conforme são lidos"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs: List[str] = []
+        self._buffer: List[str] = []
+        self._skip_depth = 0
+
+    def _end_paragraph(self):
+        if self._buffer:
+            paragraph = WHITESPACE_RE.sub(' ', ''.join(self._buffer)).strip()
+            if paragraph:
+                self.paragraphs.append(paragraph)
+            self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._buffer.append(data)
+
+    def close(self):
+        super().close()
+        self._end_paragraph()
+
+
+class EpubExtractor:
+    """Extrai metadados e texto de um EPUB sem DRM"""
+
+    def __init__(self, epub_path: str):
+        self.epub_path = Path(epub_path)
+        try:
+            self.zip = zipfile.ZipFile(self.epub_path)
+        except zipfile.BadZipFile as e:
+            raise EpubError(f"Container zip inválido: {e}") from e
+
+        try:
+            self.opf_path = self._find_opf()
+            self.opf_dir = posixpath.dirname(self.opf_path)
+            self.metadata, self.spine = self._parse_opf()
+            self._check_drm()
+        except BaseException:
+            self.zip.close()
+            raise
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _find_opf(self) -> str:
+        """Localiza o pacote OPF via META-INF/container.xml"""
+        try:
+            with self.zip.open("META-INF/container.xml") as f:
+                container = ET.parse(f).getroot()
+        except KeyError as e:
+            raise EpubError("META-INF/container.xml ausente") from e
+        except ET.ParseError as e:
+            raise EpubError(f"META-INF/container.xml malformado: {e}") from e
+
+        rootfile = container.find(".//container:rootfile", NAMESPACES)
+        if rootfile is None or not rootfile.get("full-path"):
+            raise EpubError("Pacote OPF não declarado no container")
+        return rootfile.get("full-path")
+
+    def _parse_opf(self) -> Tuple[Dict[str, str], List[str]]:
+        """Lê metadados e ordem de leitura (spine) do OPF"""
+        try:
+            with self.zip.open(self.opf_path) as f:
+                package = ET.parse(f).getroot()
+        except KeyError as e:
+            raise EpubError(f"Pacote OPF ausente: {self.opf_path}") from e
+        except ET.ParseError as e:
+            raise EpubError(f"Pacote OPF malformado: {e}") from e
+
+        metadata = parse_opf_metadata(package)
+
+        manifest = {
+            item.get("id"): item.get("href")
+            for item in package.iterfind("opf:manifest/opf:item", NAMESPACES)
+        }
+        spine = []
+        for itemref in package.iterfind("opf:spine/opf:itemref", NAMESPACES):
+            href = manifest.get(itemref.get("idref"))
+            if href:
+                spine.append(posixpath.normpath(
+                    posixpath.join(self.opf_dir, unquote(href.split("#")[0]))
+                ))
+
+        if not spine:
+            raise EpubError("Spine vazio")
+        return metadata, spine
+
+    def _check_drm(self):
+        """Recusa EPUBs com conteúdo criptografado (DRM)"""
+        try:
+            with self.zip.open("META-INF/encryption.xml") as f:
+                encryption = ET.parse(f).getroot()
+        except KeyError:
+            return
+        except ET.ParseError as e:
+            # Sem entender o encryption.xml não dá para descartar DRM
+            raise EpubError(f"META-INF/encryption.xml malformado: {e}") from e
+
+        spine = set(self.spine)
+        for data in encryption.iterfind(".//enc:EncryptedData", NAMESPACES):
+            method = data.find("enc:EncryptionMethod", NAMESPACES)
+            reference = data.find(".//enc:CipherReference", NAMESPACES)
+            algorithm = method.get("Algorithm") if method is not None else None
+            uri = unquote(reference.get("URI", "")) if reference is not None else ""
+            if algorithm in FONT_OBFUSCATION:
+                continue
+            if uri in spine or not uri.lower().endswith((".ttf", ".otf", ".woff")):
+                raise EpubError("EPUB protegido por DRM")
+
+    def iter_paragraphs(self) -> Iterator[str]:
+        """Gera os parágrafos do livro na ordem de leitura"""
+        for name in self.spine:
+            parser = _SpineTextParser()
+            try:
+                raw = self.zip.open(name)
+            except KeyError:
+                continue
+            with io.TextIOWrapper(raw, encoding="utf-8", errors="replace") as f:
+                for block in iter(lambda: f.read(READ_SIZE), ""):
+                    parser.feed(block)
+                    yield from parser.paragraphs
+                    parser.paragraphs = []
+            parser.close()
+            yield from parser.paragraphs
+
+    def write_text(self, output_file: str) -> int:
+        """
+        Grava o texto do livro, um parágrafo por bloco (comprimido se o
+        nome terminar em .gz ou .zst)
+
+        Returns:
+            Número de caracteres gravados
+        """
+        written = 0
+        with open_text(output_file, "w") as out:
+            for paragraph in self.iter_paragraphs():
+                written += out.write(paragraph)
+                written += out.write("\n\n")
+        return written
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Fingerprint de Arquivos de Livros
+Hash de conteúdo e assinatura de stat usados para identificar livros já processados
+"""
+
+import os
+import json
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+
+# BLAKE2b é mais rápido que MD5 em CPUs de 64 bits e faz parte da stdlib.
+# 16 bytes de digest mantêm o mesmo tamanho das chaves MD5 antigas.
+DEFAULT_ALGORITHM = "blake2b"
+BUFFER_SIZE = 1024 * 1024
+# Sidecar gravado pela exportação ao lado do livro (oculto, para não ser
+# confundido com um livro na busca de arquivos do lote)
+SIDECAR_PREFIX = "."
+SIDECAR_SUFFIX = ".fingerprint.json"
+
+
+def new_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    """Cria o objeto de hash para o algoritmo configurado"""
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+
+def file_digests(filepath: str, algorithms: Iterable[str]) -> Dict[str, str]:
+    """
+    Calcula vários hashes do arquivo em uma única leitura
+
+    Args:
+        filepath: Caminho do arquivo
+        algorithms: Algoritmos desejados (ex: "blake2b", "md5")
+
+    Returns:
+        Dicionário algoritmo -> hexdigest
+    """
+    hashers = {algorithm: new_hasher(algorithm) for algorithm in algorithms}
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+
+    # Leituras grandes em buffer reutilizado; o hashlib libera o GIL
+    # para blocos grandes, então várias threads podem hashear em paralelo
+    with open(filepath, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            for hasher in hashers.values():
+                hasher.update(view[:size])
+
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+
+def file_fingerprint(filepath: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """Calcula o hash de conteúdo do arquivo"""
+    return file_digests(filepath, [algorithm])[algorithm]
+
+
+def stat_signature(filepath: str) -> Dict[str, int]:
+    """
+    Assinatura barata do arquivo: tamanho, mtime e inode
+
+    Se a assinatura não mudou, o conteúdo é considerado o mesmo e o
+    hash não precisa ser recalculado.
+    """
+    st = os.stat(filepath)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino
+    }
+
+
+def sidecar_path(filepath: str) -> str:
+    """Caminho do sidecar de fingerprint de um arquivo"""
+    directory, name = os.path.split(filepath)
+    return os.path.join(directory, f"{SIDECAR_PREFIX}{name}{SIDECAR_SUFFIX}")
+
+
+def sidecar_target(path: str) -> Optional[str]:
+    """Arquivo descrito por um sidecar, ou None se o caminho não é um sidecar"""
+    directory, name = os.path.split(path)
+    if not (name.startswith(SIDECAR_PREFIX) and name.endswith(SIDECAR_SUFFIX)):
+        return None
+    target = name[len(SIDECAR_PREFIX):-len(SIDECAR_SUFFIX)]
+    return os.path.join(directory, target) if target else None
+
+
+def move_sidecar(filepath: str, new_path: str):
+    """Acompanha a mudança de lugar do arquivo (o inode, e a assinatura, não mudam)"""
+    try:
+        os.replace(sidecar_path(filepath), sidecar_path(new_path))
+    except FileNotFoundError:
+        pass
+
+
+def write_sidecar(filepath: str,
+                  digest: str,
+                  algorithm: str = DEFAULT_ALGORITHM,
+                  source: Optional[Dict[str, Any]] = None):
+    """
+    Registra o hash já calculado do arquivo, com a assinatura de stat atual
+
+    Args:
+        source: Origem da cópia ({"path", "size", "mtime_ns", "inode"}),
+            para a exportação saber se a origem mudou sem relê-la
+    """
+    record = {
+        "algorithm": algorithm,
+        "hash": digest,
+        "signature": stat_signature(filepath),
+    }
+    if source is not None:
+        record["source"] = source
+    path = sidecar_path(filepath)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def read_sidecar(filepath: str, algorithm: str = DEFAULT_ALGORITHM) -> Optional[Dict[str, Any]]:
+    """
+    Sidecar do arquivo, se ainda valer para o conteúdo atual
+
+    Returns:
+        O registro gravado por write_sidecar, ou None se não existe, é de
+        outro algoritmo ou o arquivo mudou (tamanho, mtime ou inode)
+    """
+    try:
+        with open(sidecar_path(filepath), "r", encoding="utf-8") as f:
+            record = json.load(f)
+        signature = stat_signature(filepath)
+    except (OSError, ValueError):
+        return None
+    if record.get("algorithm") != algorithm or record.get("signature") != signature:
+        return None
+    return record
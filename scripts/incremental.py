@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Re-sumarização Incremental
+Compara a versão revisada de uma transcrição com a anterior, por
+parágrafo, e refaz apenas os chunks afetados
+"""
+
+import re
+import difflib
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from chunker import iter_chunks
+
+PARAGRAPH_BREAK_RE = re.compile(r'\n[ \t]*\n')
+
+
+def split_paragraphs(text: str) -> List[Tuple[int, str]]:
+    """
+    Divide o texto em parágrafos (blocos separados por linha em branco)
+
+    Returns:
+        Lista de (posição inicial, parágrafo)
+    """
+    paragraphs = []
+    position = 0
+    for match in PARAGRAPH_BREAK_RE.finditer(text):
+        paragraphs.append((position, text[position:match.start()]))
+        position = match.start()
+    paragraphs.append((position, text[position:]))
+    return paragraphs
+
+
+class TextDiff:
+    """
+    Diferença entre duas versões de um texto, por parágrafo
+
+    Posições de trechos inalterados da versão anterior podem ser
+    convertidas para a nova versão com map_offset.
+    """
+
+    def __init__(self, old_text: str, new_text: str):
+        self.old_text = old_text
+        self.new_text = new_text
+        old_paragraphs = split_paragraphs(old_text)
+        new_paragraphs = split_paragraphs(new_text)
+
+        matcher = difflib.SequenceMatcher(
+            None,
+            [paragraph for _, paragraph in old_paragraphs],
+            [paragraph for _, paragraph in new_paragraphs],
+            autojunk=False
+        )
+
+        # Trechos iguais como (início antigo, fim antigo, início novo)
+        self.equal: List[Tuple[int, int, int]] = []
+        self.changed_paragraphs = 0
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != 'equal':
+                self.changed_paragraphs += max(i2 - i1, j2 - j1)
+                continue
+            old_start = old_paragraphs[i1][0]
+            old_end = old_paragraphs[i2][0] if i2 < len(old_paragraphs) else len(old_text)
+            self.equal.append((old_start, old_end, new_paragraphs[j1][0]))
+        self._starts = [start for start, _, _ in self.equal]
+
+    @property
+    def unchanged(self) -> bool:
+        return self.old_text == self.new_text
+
+    def map_range(self, start: int, end: int) -> Optional[int]:
+        """
+        Converte um trecho [start, end) da versão anterior
+
+        Returns:
+            Posição inicial na nova versão, ou None se o trecho foi alterado
+        """
+        position = bisect_right(self._starts, start) - 1
+        if position < 0:
+            return None
+        old_start, old_end, new_start = self.equal[position]
+        if end > old_end:
+            return None
+        return new_start + (start - old_start)
+
+
+def carried_breaks(old_chunks: List[Dict[str, Any]], diff: TextDiff) -> List[int]:
+    """
+    Posições na nova versão onde os chunks inalterados começavam
+
+    Forçar esses cortes faz o chunker reproduzir exatamente os chunks
+    anteriores nos trechos sem mudanças, em vez de deslocar todos os
+    cortes depois de uma edição.
+    """
+    breaks = []
+    for chunk in old_chunks:
+        start = diff.map_range(chunk["start"], chunk["end"])
+        if start is not None:
+            breaks.append(start + chunk.get("overlap", 0))
+    return breaks
+
+
+def incremental_chunks(old_text: str,
+                       new_text: str,
+                       old_chunks: List[Dict[str, Any]],
+                       chunk_size: int,
+                       chunk_overlap: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Refaz os chunks da nova versão aproveitando os cortes da anterior
+
+    Returns:
+        (chunks da nova versão, estatísticas)
+    """
+    diff = TextDiff(old_text, new_text)
+    breaks = carried_breaks(old_chunks, diff)
+    chunks = list(iter_chunks(new_text.split('\n'), chunk_size, chunk_overlap, breaks))
+
+    previous = {chunk["text"] for chunk in old_chunks}
+    reused = sum(1 for chunk in chunks if chunk["text"] in previous)
+    stats = {
+        "changed_paragraphs": diff.changed_paragraphs,
+        "chunks": len(chunks),
+        "chunks_reused": reused,
+        "chunks_changed": len(chunks) - reused,
+    }
+    return chunks, stats
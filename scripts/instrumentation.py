@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Instrumentação por Etapa
+Mede tempo de relógio, tempo de CPU, bytes lidos/escritos e tempo em
+subprocessos de cada etapa do processamento, com exportação em JSON lines
+e no formato texto do Prometheus (textfile collector)
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Contadores de I/O da thread atual (Linux): rchar/wchar contam os bytes
+# passados a read()/write(), inclusive os servidos pelo page cache
+THREAD_IO_PATH = "/proc/thread-self/io"
+FIELDS = (
+    "wall_seconds",
+    "cpu_seconds",
+    "read_bytes",
+    "write_bytes",
+    "subprocess_seconds",
+    "subprocesses",
+)
+METRIC_HELP = {
+    "wall_seconds": ("counter", "Tempo de relógio gasto na etapa"),
+    "cpu_seconds": ("counter", "Tempo de CPU da thread na etapa (sem subprocessos)"),
+    "read_bytes": ("counter", "Bytes lidos pela thread na etapa"),
+    "write_bytes": ("counter", "Bytes escritos pela thread na etapa"),
+    "subprocess_seconds": ("counter", "Tempo de relógio em subprocessos (Calibre)"),
+    "subprocesses": ("counter", "Subprocessos executados na etapa"),
+    "runs": ("counter", "Execuções da etapa"),
+}
+
+_local = threading.local()
+_export_lock = threading.Lock()
+
+
+def _thread_io() -> Optional[Tuple[int, int, int]]:
+    """
+    Bytes lidos e escritos pela thread atual
+
+    Returns:
+        (rchar, wchar, bytes lidos do próprio /proc), ou None fora do Linux
+    """
+    try:
+        with open(THREAD_IO_PATH, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    counters = {}
+    for line in data.splitlines():
+        name, _, value = line.partition(b":")
+        counters[name] = int(value)
+    return counters.get(b"rchar", 0), counters.get(b"wchar", 0), len(data)
+
+
+class Metrics:
+    """
+    Métricas acumuladas por etapa
+
+    Cada etapa é um dicionário com os campos de FIELDS e "runs" (quantas
+    vezes foi medida). Seguro para uso por várias threads.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Mede o bloco como a etapa "name" (tempo registrado mesmo com erro)"""
+        io_before = _thread_io()
+        cpu_before = time.thread_time()
+        wall_before = time.perf_counter()
+        record = {"subprocess_seconds": 0.0, "subprocesses": 0}
+        parent = getattr(_local, "stage", None)
+        _local.stage = record
+        try:
+            yield
+        finally:
+            _local.stage = parent
+            values = {
+                "wall_seconds": time.perf_counter() - wall_before,
+                "cpu_seconds": time.thread_time() - cpu_before,
+                "subprocess_seconds": record["subprocess_seconds"],
+                "subprocesses": record["subprocesses"],
+            }
+            io_after = _thread_io()
+            if io_before and io_after:
+                # A leitura de /proc feita antes da etapa também conta em rchar
+                values["read_bytes"] = io_after[0] - io_before[0] - io_before[2]
+                values["write_bytes"] = io_after[1] - io_before[1]
+            if parent is not None:
+                # Etapas aninhadas: o tempo em subprocessos também conta na externa
+                parent["subprocess_seconds"] += record["subprocess_seconds"]
+                parent["subprocesses"] += record["subprocesses"]
+            self.add(name, values)
+
+    def add(self, name: str, values: Dict[str, float], runs: int = 1):
+        """Soma valores medidos à etapa"""
+        with self._lock:
+            stage = self.stages.setdefault(name, {"runs": 0})
+            stage["runs"] += runs
+            for field, value in values.items():
+                stage[field] = stage.get(field, 0) + value
+
+    def count(self, name: str, amount: int = 1):
+        """Incrementa um contador (livros processados, em cache, com erro...)"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other: "Metrics"):
+        """Acumula as etapas e contadores de outra instância"""
+        snapshot = other.as_dict()
+        for name, values in snapshot["stages"].items():
+            values = dict(values)
+            self.add(name, values, values.pop("runs"))
+        for name, amount in snapshot["counters"].items():
+            self.count(name, amount)
+
+    def timings(self) -> Dict[str, float]:
+        """Tempo de relógio por etapa, em segundos"""
+        with self._lock:
+            return {name: stage["wall_seconds"] for name, stage in self.stages.items()}
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {
+                        field: round(value, 6) if isinstance(value, float) else value
+                        for field, value in stage.items()
+                    }
+                    for name, stage in self.stages.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+
+def run_subprocess(cmd, **kwargs):
+    """
+    subprocess.run que soma a duração do processo à etapa em andamento
+
+    O tempo de CPU do filho não aparece em cpu_seconds (que é da thread),
+    então o tempo no Calibre é registrado separadamente.
+    """
+    import subprocess
+
+    started = time.perf_counter()
+    try:
+        return subprocess.run(cmd, **kwargs)
+    finally:
+        record = getattr(_local, "stage", None)
+        if record is not None:
+            record["subprocess_seconds"] += time.perf_counter() - started
+            record["subprocesses"] += 1
+
+
+def append_jsonl(path: str, record: Dict[str, Any]):
+    """Acrescenta um registro (com timestamp) ao arquivo JSON lines"""
+    path = os.path.expanduser(path)
+    line = json.dumps(
+        {"timestamp": datetime.now().isoformat(), **record},
+        ensure_ascii=False
+    )
+    with _export_lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(metrics: Metrics, prefix: str = "kindle_processor") -> str:
+    """Métricas no formato de exposição em texto do Prometheus"""
+    snapshot = metrics.as_dict()
+    lines = []
+    for field, (kind, description) in METRIC_HELP.items():
+        samples = [
+            (name, stage[field]) for name, stage in sorted(snapshot["stages"].items())
+            if field in stage
+        ]
+        if not samples:
+            continue
+        metric = f"{prefix}_stage_{field}"
+        if not metric.endswith("_total"):
+            metric += "_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, value in samples:
+            lines.append(f'{metric}{{stage="{_label(name)}"}} {value}')
+
+    if snapshot["counters"]:
+        metric = f"{prefix}_books_total"
+        lines.append(f"# HELP {metric} Livros por resultado do processamento")
+        lines.append(f"# TYPE {metric} counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{metric}{{outcome="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str, metrics: Metrics, prefix: str = "kindle_processor"):
+    """
+    Grava o arquivo .prom de forma atômica
+
+    O textfile collector do node_exporter pode ler o arquivo a qualquer
+    momento, então ele nunca deve ficar pela metade.
+    """
+    path = os.path.expanduser(path)
+    text = prometheus_text(metrics, prefix)
+    with _export_lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
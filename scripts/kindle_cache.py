@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Cache de Livros Processados
+Backends plugáveis (SQLite e JSON) para o cache do KindleProcessor
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, List
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(lock_path: Path):
+    """Lock exclusivo entre processos baseado em arquivo"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CacheBackend:
+    """
+    Interface dos backends de cache
+
+    Cada entrada é o dicionário de resultado de um livro, indexado pelo
+    hash do conteúdo. Os caminhos em que o livro foi visto ficam em um
+    índice separado (caminho -> hash + stat) para evitar rehash.
+
+    Vários processos podem usar o mesmo cache: as escritas ficam
+    pendentes em memória e são mescladas ao armazenamento em flush(),
+    e claim()/release() dão a um único worker o direito de converter
+    um livro por um tempo limitado (lease).
+    """
+
+    def __init__(self):
+        # os.uname/os.urandom evitam importar socket e uuid (~25 ms na partida)
+        host = os.uname().nodename if hasattr(os, "uname") else os.environ.get("COMPUTERNAME", "")
+        self.host = host
+        self.owner = f"{host}:{os.getpid()}:{os.urandom(4).hex()}"
+
+    def _claim_active(self, owner: str, expires_at: float, now: float) -> bool:
+        """
+        O lease de outro worker ainda vale?
+
+        Além de expirar pelo tempo, um lease de um processo desta mesma
+        máquina que já morreu (lote interrompido) é liberado na hora.
+        """
+        if owner == self.owner or expires_at <= now:
+            return False
+        host, _, rest = owner.partition(":")
+        pid = rest.split(":", 1)[0]
+        if os.name == "posix" and host == self.host and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return True
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, file_hash: str, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def rekey(self, old_hash: str, new_hash: str, algorithm: str):
+        """Move uma entrada para nova chave (migração de algoritmo de hash)"""
+        raise NotImplementedError
+
+    def has_legacy_entries(self) -> bool:
+        """Indica se existem entradas sem "hash_algorithm" (chaves MD5)"""
+        raise NotImplementedError
+
+    def find_source(self, path: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        """Retorna (hash, stat) registrados para o caminho"""
+        raise NotImplementedError
+
+    def add_source(self, file_hash: str, path: str, signature: Dict[str, int]):
+        raise NotImplementedError
+
+    def remove_source(self, path: str):
+        raise NotImplementedError
+
+    def claim(self, file_hash: str, ttl: float) -> bool:
+        """
+        Reserva o livro para este worker
+
+        Returns:
+            False se outro worker tem um lease ainda válido
+        """
+        raise NotImplementedError
+
+    def release(self, file_hash: str):
+        """Libera o lease obtido com claim()"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Persiste escritas pendentes"""
+
+    def close(self):
+        self.flush()
+
+    def __contains__(self, file_hash: str) -> bool:
+        return self.get(file_hash) is not None
+
+
+def _apply_op(entries: Dict[str, Dict[str, Any]], op: Tuple):
+    """Aplica uma operação pendente ao dicionário do cache JSON"""
+    kind = op[0]
+    if kind == "put":
+        _, file_hash, entry = op
+        sources = entries.get(file_hash, {}).get("sources", {})
+        entries[file_hash] = dict(entry, sources=sources)
+    elif kind == "rekey":
+        _, old_hash, new_hash, algorithm = op
+        entry = entries.pop(old_hash, None)
+        if entry is not None and new_hash not in entries:
+            entry["hash"] = new_hash
+            entry["hash_algorithm"] = algorithm
+            entries[new_hash] = entry
+    elif kind == "add_source":
+        _, file_hash, path, signature = op
+        for entry in entries.values():
+            entry.get("sources", {}).pop(path, None)
+        if file_hash in entries:
+            entries[file_hash].setdefault("sources", {})[path] = signature
+    elif kind == "remove_source":
+        _, path = op
+        for entry in entries.values():
+            entry.get("sources", {}).pop(path, None)
+
+
+class JsonCacheBackend(CacheBackend):
+    """
+    Cache em um único arquivo JSON (formato original)
+
+    flush() relê o arquivo sob lock, aplica as operações pendentes deste
+    processo e grava de forma atômica, preservando entradas gravadas por
+    outros processos nesse meio tempo.
+    """
+
+    def __init__(self, cache_file: str, commit_every: int = 1):
+        super().__init__()
+        self.cache_path = Path(cache_file).expanduser()
+        self.lock_path = self.cache_path.with_name(self.cache_path.name + ".lock")
+        self.claims_path = self.cache_path.with_name(self.cache_path.name + ".claims")
+        self.commit_every = max(1, commit_every)
+        self._lock = threading.RLock()
+        self._ops: List[Tuple] = []
+        self._version = None
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._sources: Dict[str, Tuple[str, Dict[str, int]]] = {}
+        self._refresh()
+
+    def _disk_version(self):
+        try:
+            st = os.stat(self.cache_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """Recarrega o arquivo se outro processo o alterou"""
+        version = self._disk_version()
+        if version == self._version and version is not None:
+            return
+        entries = {}
+        if version is not None:
+            with open(self.cache_path, 'r') as f:
+                entries = json.load(f)
+        for op in self._ops:
+            _apply_op(entries, op)
+        self.entries = entries
+        self._version = version
+        self._sources = {}
+        for file_hash, entry in self.entries.items():
+            for path, signature in entry.get("sources", {}).items():
+                self._sources[path] = (file_hash, signature)
+
+    def _record(self, op: Tuple):
+        _apply_op(self.entries, op)
+        self._ops.append(op)
+        if len(self._ops) >= self.commit_every:
+            self.flush()
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(file_hash)
+            if entry is None:
+                self._refresh()
+                entry = self.entries.get(file_hash)
+        if entry is None:
+            return None
+        return {key: value for key, value in entry.items() if key != "sources"}
+
+    def put(self, file_hash: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._record(("put", file_hash, entry))
+
+    def rekey(self, old_hash: str, new_hash: str, algorithm: str):
+        with self._lock:
+            for path, signature in self.entries.get(old_hash, {}).get("sources", {}).items():
+                self._sources[path] = (new_hash, signature)
+            self._record(("rekey", old_hash, new_hash, algorithm))
+
+    def has_legacy_entries(self) -> bool:
+        return any("hash_algorithm" not in entry for entry in self.entries.values())
+
+    def find_source(self, path: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        return self._sources.get(path)
+
+    def add_source(self, file_hash: str, path: str, signature: Dict[str, int]):
+        with self._lock:
+            self._sources[path] = (file_hash, signature)
+            self._record(("add_source", file_hash, path, signature))
+
+    def remove_source(self, path: str):
+        with self._lock:
+            if self._sources.pop(path, None) is not None:
+                self._record(("remove_source", path))
+
+    def claim(self, file_hash: str, ttl: float) -> bool:
+        with self._lock, file_lock(self.lock_path):
+            claims = self._read_claims()
+            now = time.time()
+            current = claims.get(file_hash)
+            if current and self._claim_active(current["owner"], current["expires_at"], now):
+                return False
+            claims = {h: c for h, c in claims.items() if c["expires_at"] > now}
+            claims[file_hash] = {"owner": self.owner, "expires_at": now + ttl}
+            self._write_json(self.claims_path, claims)
+            return True
+
+    def release(self, file_hash: str):
+        with self._lock, file_lock(self.lock_path):
+            claims = self._read_claims()
+            if claims.get(file_hash, {}).get("owner") == self.owner:
+                del claims[file_hash]
+                self._write_json(self.claims_path, claims)
+
+    def _read_claims(self) -> Dict[str, Dict[str, Any]]:
+        if not self.claims_path.exists():
+            return {}
+        with open(self.claims_path, 'r') as f:
+            return json.load(f)
+
+    def _write_json(self, path: Path, data: Dict[str, Any], indent: Optional[int] = None):
+        # Escrita atômica: um crash no meio não corrompe o arquivo
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        with self._lock:
+            if not self._ops:
+                return
+            with file_lock(self.lock_path):
+                # Merge-on-write: parte do estado atual do disco
+                self._version = None
+                self._refresh()
+                self._write_json(self.cache_path, self.entries, indent=2)
+                self._ops = []
+                self._version = self._disk_version()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache em SQLite: uma linha por livro, modo WAL e commits em lote
+
+    As escritas ficam em memória até acumular "commit_every" alterações
+    ou até flush(), e então entram em uma única transação curta. Assim o
+    lock de escrita do banco nunca fica preso durante uma conversão e
+    outros processos continuam gravando normalmente.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            hash TEXT PRIMARY KEY,
+            hash_algorithm TEXT,
+            processed_at TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS books_legacy
+            ON books(hash) WHERE hash_algorithm IS NULL;
+        CREATE TABLE IF NOT EXISTS sources (
+            path TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sources_hash ON sources(hash);
+        CREATE TABLE IF NOT EXISTS claims (
+            hash TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self,
+                 db_file: str,
+                 legacy_json: Optional[str] = None,
+                 commit_every: int = 20):
+        super().__init__()
+        self.db_path = Path(db_file).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_every = max(1, commit_every)
+        self._lock = threading.RLock()
+
+        # Escritas pendentes: hash -> entrada (None = removida),
+        # caminho -> (hash, stat) (None = removido) e renomeações de hash
+        self._books: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._sources: Dict[str, Optional[Tuple[str, Dict[str, int]]]] = {}
+        self._rekeys: Dict[str, str] = {}
+        self._pending = 0
+
+        # Autocommit: transações são abertas explicitamente com BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+        if legacy_json:
+            self._migrate_json(Path(legacy_json).expanduser())
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _migrate_json(self, json_path: Path):
+        """Importa o cache JSON antigo uma única vez"""
+        if not json_path.exists():
+            return
+
+        with self._lock, self._transaction():
+            done = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+            if done:
+                return
+
+            with open(json_path, 'r') as f:
+                entries = json.load(f)
+
+            for file_hash, entry in entries.items():
+                sources = entry.pop("sources", {})
+                self._write_book(file_hash, entry)
+                for path, signature in sources.items():
+                    self._write_source(path, (file_hash, signature))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (str(json_path),)
+            )
+
+        migrated_path = json_path.with_name(json_path.name + ".migrated")
+        os.replace(json_path, migrated_path)
+        logger.info(
+            f"Cache JSON migrado para SQLite ({len(entries)} livros): {migrated_path}"
+        )
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if file_hash in self._books:
+                return self._books[file_hash]
+            row = self.conn.execute(
+                "SELECT data FROM books WHERE hash = ?", (file_hash,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_book(self, file_hash: str, entry: Optional[Dict[str, Any]]):
+        if entry is None:
+            self.conn.execute("DELETE FROM books WHERE hash = ?", (file_hash,))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO books (hash, hash_algorithm, processed_at, data) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                file_hash,
+                entry.get("hash_algorithm"),
+                entry.get("processed_at"),
+                json.dumps(entry, ensure_ascii=False)
+            )
+        )
+
+    def _write_source(self, path: str, indexed: Optional[Tuple[str, Dict[str, int]]]):
+        if indexed is None:
+            self.conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+            return
+        file_hash, signature = indexed
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sources (path, hash, size, mtime_ns, inode) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (path, file_hash, signature["size"], signature["mtime_ns"], signature["inode"])
+        )
+
+    def put(self, file_hash: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._books[file_hash] = entry
+            self._mark_dirty()
+
+    def rekey(self, old_hash: str, new_hash: str, algorithm: str):
+        with self._lock:
+            entry = self.get(old_hash)
+            if entry is None:
+                return
+            entry["hash"] = new_hash
+            entry["hash_algorithm"] = algorithm
+            self._books[old_hash] = None
+            self._books[new_hash] = entry
+            self._rekeys[old_hash] = new_hash
+            self._mark_dirty()
+
+    def has_legacy_entries(self) -> bool:
+        with self._lock:
+            (count,) = self.conn.execute(
+                "SELECT COUNT(*) FROM books WHERE hash_algorithm IS NULL"
+            ).fetchone()
+            # Renomeações pendentes só existem para entradas antigas
+            return count > len(self._rekeys)
+
+    def find_source(self, path: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        with self._lock:
+            if path in self._sources:
+                return self._sources[path]
+            row = self.conn.execute(
+                "SELECT hash, size, mtime_ns, inode FROM sources WHERE path = ?",
+                (path,)
+            ).fetchone()
+        if not row:
+            return None
+        file_hash = self._rekeys.get(row[0], row[0])
+        return file_hash, {"size": row[1], "mtime_ns": row[2], "inode": row[3]}
+
+    def add_source(self, file_hash: str, path: str, signature: Dict[str, int]):
+        with self._lock:
+            self._sources[path] = (file_hash, signature)
+            self._mark_dirty()
+
+    def remove_source(self, path: str):
+        with self._lock:
+            self._sources[path] = None
+            self._mark_dirty()
+
+    def claim(self, file_hash: str, ttl: float) -> bool:
+        with self._lock, self._transaction():
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT owner, expires_at FROM claims WHERE hash = ?", (file_hash,)
+            ).fetchone()
+            if row and self._claim_active(row[0], row[1], now):
+                return False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO claims (hash, owner, expires_at) VALUES (?, ?, ?)",
+                (file_hash, self.owner, now + ttl)
+            )
+            return True
+
+    def release(self, file_hash: str):
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM claims WHERE hash = ? AND owner = ?",
+                (file_hash, self.owner)
+            )
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            with self._transaction():
+                for old_hash, new_hash in self._rekeys.items():
+                    self.conn.execute(
+                        "UPDATE sources SET hash = ? WHERE hash = ?", (new_hash, old_hash)
+                    )
+                for file_hash, entry in self._books.items():
+                    self._write_book(file_hash, entry)
+                for path, indexed in self._sources.items():
+                    self._write_source(path, indexed)
+            self._books.clear()
+            self._sources.clear()
+            self._rekeys.clear()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+
+def open_cache(config: Dict[str, Any]) -> CacheBackend:
+    """Cria o backend de cache definido em config["cache_backend"]"""
+    backend = config.get("cache_backend", "sqlite")
+    commit_every = config.get("cache_commit_every", 20)
+
+    if backend == "json":
+        return JsonCacheBackend(config["cache_file"], commit_every=commit_every)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(
+            config["cache_db"],
+            legacy_json=config.get("cache_file"),
+            commit_every=commit_every
+        )
+
+    raise ValueError(f"Backend de cache desconhecido: {backend}")
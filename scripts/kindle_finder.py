@@ -5,17 +5,49 @@ Kindle Finder - Encontra e lista livros do Kindle no computador
 
 import os
 import json
+import fnmatch
 import sqlite3
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Optional
-import shutil
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from book_export import COPY, COPY_RANGE, HARDLINK, REFLINK, SKIPPED, export_file, summarize
+from library_index import DEFAULT_INDEX_PATH, LibraryIndex, book_record
+
+BOOK_PATTERNS = ('*.azw*', '*.mobi')
+# Pastas verificadas por tarefa do pool (tarefas por pasta custam mais
+# em overhead do que o stat em disco local)
+FOLDERS_PER_TASK = 64
+# Tabelas de metadados conhecidas do book_asset.db, por versão do app
+KINDLE_DB_SCHEMAS = (
+    ('book_metadata', ('ASIN', 'Title', 'Authors', 'Publisher')),
+    ('Books', ('ASIN', 'title', 'authors', 'publisher')),
+    ('kindle_books', ('id', 'title', 'author', 'publisher')),
+)
+DB_FETCH_SIZE = 1000
 
 class KindleFinder:
     """Localiza e identifica livros do Kindle"""
     
-    def __init__(self):
+    def __init__(self,
+                 index_path: Optional[str] = DEFAULT_INDEX_PATH,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            index_path: Índice persistente da biblioteca (None = sem
+                persistência, toda busca varre as pastas do zero)
+            workers: Threads da varredura e da exportação (padrão: 4 por CPU, até 32;
+                a varredura é limitada por I/O, não por CPU)
+        """
         self.kindle_paths = self._get_kindle_paths()
         self.books = []
+        self.index = LibraryIndex(index_path or ":memory:")
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.scan_stats: Dict[str, Dict] = {}
+        # Por caminho do book_asset.db: esquema detectado e (mtime, metadados)
+        self._db_schemas: Dict[str, Optional[Tuple[str, Tuple[str, ...]]]] = {}
+        self._db_cache: Dict[str, Tuple[int, Dict[str, Dict]]] = {}
         
     def _get_kindle_paths(self) -> List[Path]:
         """Retorna possíveis localizações dos livros Kindle"""
@@ -39,89 +71,333 @@ class KindleFinder:
         return paths
     
     def _read_kindle_db(self, db_path: Path) -> Dict[str, Dict]:
-        """Lê metadados do banco de dados do Kindle"""
-        metadata = {}
+        """
+        Lê metadados do banco de dados do Kindle
         
+        O banco é aberto somente leitura, para não disputar locks com o app
+        do Kindle aberto, e o resultado fica em memória até o mtime mudar.
+        """
+        key = str(db_path)
         try:
-            conn = sqlite3.connect(str(db_path))
-            cursor = conn.cursor()
-            
-            # Tentar diferentes queries dependendo da versão
-            queries = [
-                """SELECT ASIN, Title, Authors, Publisher 
-                   FROM book_metadata""",
-                """SELECT ASIN, title, authors, publisher 
-                   FROM Books""",
-                """SELECT id, title, author, publisher 
-                   FROM kindle_books"""
-            ]
-            
-            for query in queries:
-                try:
-                    cursor.execute(query)
-                    for row in cursor.fetchall():
-                        asin = row[0]
-                        metadata[asin] = {
-                            'title': row[1] or 'Unknown Title',
-                            'author': row[2] or 'Unknown Author',
-                            'publisher': row[3] or ''
-                        }
-                    break
-                except sqlite3.OperationalError:
-                    continue
-                    
-            conn.close()
+            mtime = os.stat(db_path).st_mtime_ns
+        except OSError as e:
+            print(f"Aviso: Não foi possível ler banco de dados: {e}")
+            return {}
+        cached = self._db_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        metadata = {}
+        try:
+            conn = sqlite3.connect(self._db_uri(db_path), uri=True)
+            try:
+                metadata = self._read_metadata(conn, key)
+            finally:
+                conn.close()
         except Exception as e:
             print(f"Aviso: Não foi possível ler banco de dados: {e}")
-            
+            return metadata
+        
+        self._db_cache[key] = (mtime, metadata)
         return metadata
     
-    def find_books(self) -> List[Dict]:
-        """Encontra todos os livros Kindle disponíveis"""
-        self.books = []
+    @staticmethod
+    def _db_uri(db_path: Path) -> str:
+        """
+        URI somente leitura do banco
+        
+        Com immutable=1 o SQLite nem tenta travar o arquivo; só não serve
+        se houver um -wal com transações ainda não aplicadas ao banco.
+        """
+        uri = f"{Path(db_path).absolute().as_uri()}?mode=ro"
+        wal_path = Path(f"{db_path}-wal")
+        if not (wal_path.exists() and wal_path.stat().st_size > 0):
+            uri += "&immutable=1"
+        return uri
+    
+    def _detect_schema(self, conn: sqlite3.Connection) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """Primeira tabela de KINDLE_DB_SCHEMAS presente no banco, com todas as colunas"""
+        tables = {
+            name.lower() for (name,) in
+            conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        for table, columns in KINDLE_DB_SCHEMAS:
+            if table.lower() not in tables:
+                continue
+            existing = {row[1].lower() for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            if all(column.lower() in existing for column in columns):
+                return table, columns
+        return None
+    
+    def _read_metadata(self, conn: sqlite3.Connection, key: str) -> Dict[str, Dict]:
+        if key not in self._db_schemas:
+            self._db_schemas[key] = self._detect_schema(conn)
+        schema = self._db_schemas[key]
+        if schema is None:
+            return {}
+        
+        table, columns = schema
+        metadata = {}
+        try:
+            cursor = conn.execute(f'SELECT {", ".join(columns)} FROM "{table}"')
+        except sqlite3.OperationalError:
+            # O Kindle foi atualizado e o esquema mudou: detecta de novo
+            del self._db_schemas[key]
+            raise
+        while True:
+            rows = cursor.fetchmany(DB_FETCH_SIZE)
+            if not rows:
+                break
+            for asin, title, author, publisher in rows:
+                metadata[asin] = {
+                    'title': title or 'Unknown Title',
+                    'author': author or 'Unknown Author',
+                    'publisher': publisher or ''
+                }
+        return metadata
+    
+    def _scan_folder(self, folder: str) -> Optional[Dict]:
+        """Arquivo principal (o maior) de uma pasta de livro, em uma listagem"""
+        main_file = None
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not any(fnmatch.fnmatchcase(entry.name, pattern) for pattern in BOOK_PATTERNS):
+                    continue
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                if main_file is None or st.st_size > main_file['size']:
+                    main_file = {
+                        'path': entry.path,
+                        'format': os.path.splitext(entry.name)[1],
+                        'size': st.st_size,
+                        'mtime_ns': st.st_mtime_ns
+                    }
+        return main_file
+    
+    def _list_root(self, kindle_path: Path, rescan: bool) -> Dict:
+        """
+        Primeira etapa da varredura de uma raiz (roda no pool)
+        
+        A raiz só é listada se o mtime dela mudou (senão as pastas vêm do
+        índice) e o book_asset.db só é relido se o mtime dele mudou.
+        """
+        root = str(kindle_path)
+        root_mtime, db_mtime = self.index.root_state(root)
+        known = self.index.folders(root)
+        current_root_mtime = os.stat(root).st_mtime_ns
+        
+        if rescan or current_root_mtime != root_mtime:
+            with os.scandir(root) as entries:
+                # No Windows o stat do DirEntry vem da própria listagem
+                folders = [
+                    (entry.path, entry.stat().st_mtime_ns if os.name == 'nt' else None)
+                    for entry in entries
+                    if '_EBOK' in entry.name and entry.is_dir()
+                ]
+        else:
+            folders = [(folder, None) for folder in known]
         
+        db_path = kindle_path / "book_asset.db"
+        try:
+            current_db_mtime = os.stat(db_path).st_mtime_ns
+        except FileNotFoundError:
+            current_db_mtime = None
+        metadata = None
+        if rescan or current_db_mtime != db_mtime:
+            metadata = self._read_kindle_db(db_path) if current_db_mtime else {}
+        
+        return {
+            'root': root,
+            'mtime_ns': current_root_mtime,
+            'db_mtime_ns': current_db_mtime,
+            'known': known,
+            'folders': folders,
+            'metadata': metadata
+        }
+    
+    def _check_folders(self,
+                       folders: List[Tuple[str, Optional[int]]],
+                       known: Dict[str, int],
+                       rescan: bool) -> List[Tuple[str, Optional[Tuple[int, Optional[Dict], bool]]]]:
+        """Segunda etapa (roda no pool): verifica um lote de pastas"""
+        return [
+            (folder, self._check_folder(folder, mtime, known.get(folder), rescan))
+            for folder, mtime in folders
+        ]
+    
+    def _check_folder(self,
+                      folder: str,
+                      mtime: Optional[int],
+                      known_mtime: Optional[int],
+                      rescan: bool) -> Optional[Tuple[int, Optional[Dict], bool]]:
+        """
+        Relê a pasta só se o mtime mudou
+        
+        Returns:
+            (mtime, arquivo principal, reescaneada) ou None se a pasta sumiu
+        """
+        if mtime is None:
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                return None
+        if not rescan and mtime == known_mtime:
+            return mtime, None, False
+        try:
+            return mtime, self._scan_folder(folder), True
+        except FileNotFoundError:
+            return None
+    
+    def _start_root(self, state: Dict) -> None:
+        """Grava os metadados relidos e carrega o que o índice já sabe da raiz"""
+        root = state['root']
+        if state['metadata'] is not None:
+            with self.index.transaction():
+                self.index.replace_metadata(root, state['metadata'])
+        state['db_read'] = state['metadata'] is not None
+        state['metadata'] = self.index.metadata(root)
+        state['indexed'] = {book['folder']: book for book in self.index.books(root)}
+        state['pending'] = len(state['folders'])
+        state['seen'] = set()
+        state['updates'] = []
+    
+    def _finish_root(self, state: Dict) -> None:
+        """Grava no índice, em uma transação, o resultado da varredura da raiz"""
+        root = state['root']
+        removed = [folder for folder in state['known'] if folder not in state['seen']]
+        with self.index.transaction():
+            for folder, asin, mtime, main_file in state['updates']:
+                self.index.replace_folder(root, folder, asin, mtime, main_file)
+            self.index.remove_folders(removed)
+            self.index.set_root_state(root, state['mtime_ns'], state['db_mtime_ns'])
+        self.scan_stats[root] = {
+            'folders': len(state['seen']),
+            'rescanned': len(state['updates']),
+            'removed': len(removed),
+            'records': len(state['metadata']),
+            'db_read': state['db_read']
+        }
+    
+    def iter_books(self, rescan: bool = False) -> Iterator[Dict]:
+        """
+        Gera os livros à medida que são encontrados, em ordem indefinida
+        
+        Raízes e pastas são verificadas em paralelo (self.workers threads,
+        útil em discos lentos ou de rede) e só o que mudou desde a última
+        varredura é relido; o índice é atualizado ao fim de cada raiz.
+        Estatísticas de cada raiz ficam em self.scan_stats.
+        
+        Args:
+            rescan: Ignorar o índice e varrer todas as pastas
+        """
+        self.scan_stats = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        # Tarefas concluídas chegam por esta fila, na ordem em que terminam
+        done: "queue.Queue" = queue.Queue()
+        running = 0
+        futures = []
+        
+        def submit(job, fn, *args):
+            nonlocal running
+            running += 1
+            future = executor.submit(fn, *args)
+            futures.append(future)
+            future.add_done_callback(lambda future: done.put((job, future)))
+        
+        try:
+            for kindle_path in self.kindle_paths:
+                submit(None, self._list_root, kindle_path, rescan)
+            
+            while running:
+                job, future = done.get()
+                running -= 1
+                
+                if job is None:
+                    state = future.result()
+                    self._start_root(state)
+                    folders = state['folders']
+                    for i in range(0, len(folders), FOLDERS_PER_TASK):
+                        submit(state, self._check_folders, folders[i:i + FOLDERS_PER_TASK],
+                               state['known'], rescan)
+                    if not folders:
+                        self._finish_root(state)
+                    continue
+                
+                state = job
+                books = []
+                for folder, checked in future.result():
+                    state['pending'] -= 1
+                    if checked is None:
+                        continue
+                    mtime, main_file, rescanned = checked
+                    state['seen'].add(folder)
+                    if not rescanned:
+                        book = state['indexed'].get(folder)
+                    else:
+                        asin = os.path.basename(folder).replace('_EBOK', '')
+                        state['updates'].append((folder, asin, mtime, main_file))
+                        book = None
+                        if main_file is not None:
+                            book = book_record(
+                                asin, main_file['path'], main_file['format'], main_file['size'],
+                                folder, state['metadata'].get(asin)
+                            )
+                    if book is not None:
+                        books.append(book)
+                if state['pending'] == 0:
+                    self._finish_root(state)
+                yield from books
+        finally:
+            # Se o consumidor parar no meio, o que ainda não começou é
+            # cancelado (shutdown(cancel_futures=True) só existe no 3.9+)
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    def find_books(self, rescan: bool = False) -> List[Dict]:
+        """
+        Encontra todos os livros Kindle disponíveis
+        
+        Args:
+            rescan: Ignorar o índice e varrer todas as pastas
+        """
         for kindle_path in self.kindle_paths:
             print(f"\n📂 Procurando em: {kindle_path}")
-            
-            # Ler metadados do banco se disponível
-            db_path = kindle_path / "book_asset.db"
-            metadata = {}
-            if db_path.exists():
-                metadata = self._read_kindle_db(db_path)
-                print(f"   ✓ Banco de dados encontrado com {len(metadata)} registros")
-            
-            # Procurar arquivos de livros
-            for item in kindle_path.iterdir():
-                if item.is_dir() and '_EBOK' in item.name:
-                    # É uma pasta de livro
-                    asin = item.name.replace('_EBOK', '')
-                    book_files = list(item.glob('*.azw*')) + list(item.glob('*.mobi'))
-                    
-                    if book_files:
-                        main_file = max(book_files, key=lambda f: f.stat().st_size)
-                        
-                        book_info = {
-                            'asin': asin,
-                            'path': str(main_file),
-                            'format': main_file.suffix,
-                            'size_mb': round(main_file.stat().st_size / 1024 / 1024, 2),
-                            'folder': str(item)
-                        }
-                        
-                        # Adicionar metadados se disponível
-                        if asin in metadata:
-                            book_info.update(metadata[asin])
-                        else:
-                            # Tentar extrair do nome do arquivo
-                            book_info['title'] = main_file.stem
-                            book_info['author'] = 'Unknown'
-                        
-                        self.books.append(book_info)
+        
+        self.books = list(self.iter_books(rescan))
+        
+        for root, stats in self.scan_stats.items():
+            print(f"\n📂 {root}")
+            if stats['records']:
+                origem = "lido agora" if stats['db_read'] else "do índice"
+                print(f"   ✓ Banco de dados encontrado com {stats['records']} registros ({origem})")
+            print(
+                f"   ✓ {stats['folders']} pastas, {stats['rescanned']} reescaneadas"
+                + (f", {stats['removed']} removidas" if stats['removed'] else "")
+            )
         
         # Ordenar por título
         self.books.sort(key=lambda x: x.get('title', 'Unknown'))
         return self.books
     
+    def stream_books(self, detailed: bool = False, rescan: bool = False) -> None:
+        """
+        Lista os livros à medida que são encontrados, sem esperar a varredura
+        
+        A ordem é a da descoberta, então não há numeração para o export.
+        """
+        self.books = []
+        for book in self.iter_books(rescan):
+            self.books.append(book)
+            print(f"• {book.get('title', 'Unknown Title')} — {book.get('author', 'Unknown')} "
+                  f"[{book['format']}, {book['size_mb']} MB]")
+            if detailed:
+                print(f"   ASIN: {book['asin']}  Caminho: {book['path']}")
+        
+        print(f"\n📚 Encontrados {len(self.books)} livros")
+        self.books.sort(key=lambda x: x.get('title', 'Unknown'))
+    
     def list_books(self, detailed: bool = False) -> None:
         """Lista todos os livros encontrados"""
         if not self.books:
@@ -139,59 +415,101 @@ class KindleFinder:
                 print(f"   Caminho: {book['path']}")
             print()
     
-    def export_book(self, book_index: int, output_dir: str = None) -> str:
-        """Exporta um livro para processamento"""
+    def _ensure_books(self) -> List[Dict]:
         if not self.books:
             self.find_books()
-            
-        if book_index < 1 or book_index > len(self.books):
-            raise ValueError(f"Índice inválido. Escolha entre 1 e {len(self.books)}")
-        
-        book = self.books[book_index - 1]
-        
-        # Diretório de saída
+        return self.books
+    
+    @staticmethod
+    def _output_dir(output_dir: Optional[str]) -> Path:
         if output_dir is None:
             output_dir = Path.home() / "KindleBooks" / "input"
-        else:
-            output_dir = Path(output_dir)
-            
+        output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
+        return output_dir
+    
+    @staticmethod
+    def _filename(book: Dict) -> str:
+        source = Path(book['path'])
+        return f"{book.get('title', 'Unknown').replace('/', '-')}_{book.get('author', 'Unknown').replace('/', '-')}{source.suffix}"
+    
+    def export_book(self, book_index: int, output_dir: str = None, link: bool = False) -> str:
+        """Exporta um livro para processamento"""
+        books = self._ensure_books()
+        
+        if book_index < 1 or book_index > len(books):
+            raise ValueError(f"Índice inválido. Escolha entre 1 e {len(books)}")
         
-        # Copiar arquivo
+        book = books[book_index - 1]
         source = Path(book['path'])
-        filename = f"{book.get('title', 'Unknown').replace('/', '-')}_{book.get('author', 'Unknown').replace('/', '-')}{source.suffix}"
-        destination = output_dir / filename
+        destination = self._output_dir(output_dir) / self._filename(book)
         
         print(f"\n📤 Exportando livro...")
         print(f"   De: {source}")
         print(f"   Para: {destination}")
         
-        shutil.copy2(source, destination)
+        method, _ = export_file(source, destination, link=link)
         
-        print(f"\n✅ Livro exportado com sucesso!")
+        if method == SKIPPED:
+            print(f"\n✅ Cópia idêntica já exportada, nada a copiar")
+        else:
+            print(f"\n✅ Livro exportado com sucesso! ({method})")
         print(f"\nPara processar, execute:")
         print(f"   python kindle_processor.py \"{destination}\"")
         
         return str(destination)
     
-    def export_all(self, output_dir: str = None) -> List[str]:
-        """Exporta todos os livros"""
-        if not self.books:
-            self.find_books()
-            
-        exported = []
+    def export_all(self, output_dir: str = None, link: bool = False) -> List[str]:
+        """
+        Exporta todos os livros em paralelo
         
-        print(f"\n📤 Exportando {len(self.books)} livros...")
+        Destinos idênticos à origem são pulados; livros com o mesmo título
+        e autor recebem o ASIN no nome para não se sobrescreverem.
+        """
+        books = self._ensure_books()
+        output = self._output_dir(output_dir)
         
-        for i, book in enumerate(self.books, 1):
-            try:
-                path = self.export_book(i, output_dir)
-                exported.append(path)
-            except Exception as e:
-                print(f"❌ Erro ao exportar {book.get('title', 'Unknown')}: {e}")
+        destinations = {}
+        taken = set()
+        for book in books:
+            filename = self._filename(book)
+            if filename.lower() in taken:
+                stem, suffix = os.path.splitext(filename)
+                filename = f"{stem}_{book['asin']}{suffix}"
+            taken.add(filename.lower())
+            destinations[book['path']] = output / filename
+        
+        print(f"\n📤 Exportando {len(books)} livros para {output}...")
+        
+        exported = []
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(export_file, Path(book['path']), destinations[book['path']], link): book
+                for book in books
+            }
+            for future in as_completed(futures):
+                book = futures[future]
+                try:
+                    results[book['path']] = future.result()
+                    exported.append(str(destinations[book['path']]))
+                except Exception as e:
+                    print(f"❌ Erro ao exportar {book.get('title', 'Unknown')}: {e}")
         
-        print(f"\n✅ {len(exported)} livros exportados com sucesso!")
-        return exported
+        summary = summarize(results)
+        methods = ", ".join(
+            f"{summary[method]} {method}"
+            for method in (COPY, COPY_RANGE, REFLINK, HARDLINK, SKIPPED) if summary.get(method)
+        )
+        print(f"\n✅ {len(exported)} livros exportados com sucesso!" + (f" ({methods})" if methods else ""))
+        print(f"   📦 Copiados: {summary['bytes_copied'] / 1024 / 1024:.1f} MB")
+        if summary['bytes_linked']:
+            print(f"   🔗 Sem cópia de dados (reflink/hard link): {summary['bytes_linked'] / 1024 / 1024:.1f} MB")
+        print(f"   ⏭️  Pulados (idênticos): {summary['bytes_skipped'] / 1024 / 1024:.1f} MB")
+        
+        # Na ordem da biblioteca, não na de conclusão
+        order = {str(destinations[book['path']]): i for i, book in enumerate(books)}
+        return sorted(exported, key=order.__getitem__)
 
 
 def main():
@@ -220,10 +538,44 @@ def main():
         action='store_true',
         help='Mostrar informações detalhadas'
     )
+    parser.add_argument(
+        '--rescan',
+        action='store_true',
+        help='Varrer todas as pastas, ignorando o índice da biblioteca'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Com list, mostrar os livros à medida que são encontrados (sem numeração)'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        help='Threads da varredura e da exportação (padrão: 4 por CPU, até 32)'
+    )
+    parser.add_argument(
+        '--link',
+        action='store_true',
+        help='Exportar com hard link quando origem e destino estão no mesmo disco'
+    )
+    parser.add_argument(
+        '--no-index',
+        action='store_true',
+        help='Não usar o índice persistente (~/.kindle_finder_index.sqlite3)'
+    )
     
     args = parser.parse_args()
     
-    finder = KindleFinder()
+    finder = KindleFinder(
+        index_path=None if args.no_index else DEFAULT_INDEX_PATH,
+        workers=args.workers
+    )
+    
+    if args.action == 'list' and args.stream:
+        finder.stream_books(detailed=args.detailed, rescan=args.rescan)
+        return
+    if args.rescan:
+        finder.find_books(rescan=True)
     
     if args.action == 'list':
         finder.list_books(detailed=args.detailed)
@@ -234,14 +586,14 @@ def main():
             finder.list_books()
             try:
                 index = int(input("Digite o número do livro para exportar: "))
-                finder.export_book(index, args.output)
+                finder.export_book(index, args.output, link=args.link)
             except (ValueError, KeyboardInterrupt):
                 print("\nOperação cancelada.")
         else:
-            finder.export_book(args.index, args.output)
+            finder.export_book(args.index, args.output, link=args.link)
             
     elif args.action == 'export-all':
-        finder.export_all(args.output)
+        finder.export_all(args.output, link=args.link)
 
 
 if __name__ == "__main__":
@@ -5,15 +5,32 @@ Automatiza extração, conversão e resumo de livros do Kindle
 """
 
 import os
+import re
 import sys
-import subprocess
 import json
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
-import hashlib
+from typing import Optional, Dict, Any, Tuple
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from fingerprint import (
+    DEFAULT_ALGORITHM, file_digests, file_fingerprint, move_sidecar, read_sidecar,
+    sidecar_target, stat_signature
+)
+from kindle_cache import open_cache
+from instrumentation import Metrics, append_jsonl, run_subprocess, write_prometheus
+from text_cleaner import clean_text, iter_clean_lines, iter_file_lines
+from agent_request import FORMAT as REQUEST_FORMAT, read_header, write_agent_request
+from storage import compress_file, open_binary, open_text, strip_compression, with_compression
+
+# Módulos usados apenas na conversão (subprocess, zipfile, tempfile,
+# epub_extractor, chunker...) são importados nos métodos que os usam:
+# uma consulta que termina no cache não paga o custo de importá-los.
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +38,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Saídas em andamento são gravadas com este prefixo e renomeadas ao final
+PARTIAL_PREFIX = ".part-"
+# Caracteres do hash no nome do texto gerado (livro-<hash>.txt)
+OUTPUT_HASH_CHARS = 8
+
 class KindleProcessor:
     """Processa livros do Kindle para resumo automático"""
     
@@ -32,8 +54,68 @@ class KindleProcessor:
             config_path: Caminho para arquivo de configuração customizado
         """
         self.config = self._load_config(config_path)
-        self.calibre_path = self._find_calibre()
-        self.processed_cache = self._load_cache()
+        # Calibre e cache são inicializados no primeiro uso
+        self._calibre_path: Optional[str] = None
+        self._calibre_checked = False
+        self._cache = None
+        self._duplicates = None
+        self._duplicates_checked = False
+        self._init_lock = threading.Lock()
+        # Protege cache e movimentação de arquivos no processamento concorrente
+        self._cache_lock = threading.Lock()
+        # Hashes calculados nesta execução: caminho -> (assinatura, hash)
+        self._hashes: Dict[str, Tuple[Dict[str, int], str]] = {}
+        self._hash_locks: Dict[str, threading.Lock] = {}
+        self._in_batch = False
+        # Diário do lote em andamento: registra as conversões (não os acertos de cache)
+        self._batch_journal = None
+        # Métricas por etapa acumuladas desde o início do processo
+        self.metrics = Metrics()
+        self._batch_metrics: Optional[Metrics] = None
+        self.last_batch_metrics: Optional[Dict[str, Any]] = None
+    
+    @property
+    def cache(self):
+        """Cache de livros processados, aberto no primeiro acesso"""
+        if self._cache is None:
+            with self._init_lock:
+                if self._cache is None:
+                    self._cache = open_cache(self.config)
+        return self._cache
+    
+    @property
+    def duplicates(self):
+        """Índice de quase duplicados (None se desativado), aberto no primeiro uso"""
+        if not self._duplicates_checked:
+            with self._init_lock:
+                if not self._duplicates_checked:
+                    from near_duplicates import NearDuplicateIndex
+                    self._duplicates = NearDuplicateIndex.from_config(self.config)
+                    self._duplicates_checked = True
+        return self._duplicates
+    
+    @property
+    def calibre_path(self) -> Optional[str]:
+        """Executável ebook-convert, procurado uma única vez (None se ausente)"""
+        if not self._calibre_checked:
+            with self._init_lock:
+                if not self._calibre_checked:
+                    try:
+                        self._calibre_path = self._find_calibre()
+                    except FileNotFoundError:
+                        # Sem Calibre ainda é possível processar os formatos nativos
+                        self._calibre_path = None
+                        logger.warning(
+                            "Calibre não encontrado: apenas formatos nativos "
+                            f"{self.config.get('native_formats', [])} serão processados"
+                        )
+                    self._calibre_checked = True
+        return self._calibre_path
+    
+    @calibre_path.setter
+    def calibre_path(self, path: Optional[str]):
+        self._calibre_path = path
+        self._calibre_checked = True
         
     def _load_config(self, config_path: Optional[str]) -> Dict[str, Any]:
         """Carrega configurações"""
@@ -42,12 +124,47 @@ class KindleProcessor:
             "output_format": "txt",
             "output_dir": "~/KindleBooks/output",
             "processed_dir": "~/KindleBooks/processed",
+            "cache_backend": "sqlite",  # "sqlite" ou "json"
+            "cache_db": "~/.kindle_processor_cache.sqlite3",
             "cache_file": "~/.kindle_processor_cache.json",
+            "cache_commit_every": 20,
+            "claim_ttl_seconds": 3600,  # lease de conversão entre processos
+            "claim_poll_seconds": 5,
+            "max_workers": None,  # None = número de CPUs
+            # Diário de progresso dos lotes, para retomar após interrupção
+            "batch_journal": True,
+            "journal_dir": "~/.kindle_processor_journals",
+            "hash_algorithm": DEFAULT_ALGORITHM,
+            # Formatos extraídos em Python puro; Calibre fica como fallback
+            "native_formats": [".epub"],
+            # Metadados e texto em uma única chamada ao ebook-convert (TXTZ)
+            "calibre_single_pass": True,
             "calibre_options": [
                 "--enable-heuristics",
                 "--unwrap-lines",
                 "--normalize-text"
             ],
+            # Mesmas chaves de configuracoes/config.json
+            "storage": {
+                "compression": "gzip"  # "gzip", "zstd" ou None
+            },
+            # Mesmo livro em outro formato/edição reaproveita conversão e resumos
+            "near_duplicates": {
+                "enabled": True,
+                "index_db": "~/.kindle_processor_minhash.sqlite3",
+                "threshold": 0.8,       # similaridade de Jaccard estimada
+                "sample_chars": 50000   # início do texto usado na assinatura
+            },
+            # Exportação das métricas por etapa (None = desativada)
+            "metrics": {
+                "jsonl_file": None,       # um registro por livro e por lote
+                "prometheus_file": None   # textfile collector do node_exporter
+            },
+            "processing_config": {
+                "chunk_size": 2000,
+                "chunk_overlap": 200,
+                "max_chunks_per_batch": 10
+            },
             "agente_config": {
                 "tipo_resumo": "completo",
                 "incluir_flashcards": True,
@@ -71,10 +188,10 @@ class KindleProcessor:
             "C:\\Program Files (x86)\\Calibre2\\ebook-convert.exe"  # Windows 32-bit
         ]
         
-        # Verificar se está no PATH
-        if subprocess.run(["which", "ebook-convert"], 
-                         capture_output=True).returncode == 0:
-            return "ebook-convert"
+        # Verificar se está no PATH (sem criar subprocesso)
+        found = shutil.which("ebook-convert")
+        if found:
+            return found
         
         # Verificar caminhos conhecidos
         for path in possible_paths:
@@ -85,81 +202,324 @@ class KindleProcessor:
             "Calibre não encontrado. Instale em: https://calibre-ebook.com"
         )
     
-    def _load_cache(self) -> Dict[str, Dict]:
-        """Carrega cache de livros processados"""
-        cache_path = Path(self.config["cache_file"]).expanduser()
-        if cache_path.exists():
-            with open(cache_path, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_cache(self):
-        """Salva cache de livros processados"""
-        cache_path = Path(self.config["cache_file"]).expanduser()
-        with open(cache_path, 'w') as f:
-            json.dump(self.processed_cache, f, indent=2)
-    
     def _get_file_hash(self, filepath: str) -> str:
-        """Calcula hash MD5 do arquivo"""
-        hash_md5 = hashlib.md5()
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        """Calcula hash de conteúdo do arquivo"""
+        return file_fingerprint(filepath, self.config["hash_algorithm"])
+    
+    def _resolve_hash(self, filepath: str) -> str:
+        """
+        Obtém o hash do arquivo, evitando reler o conteúdo
+        
+        Se tamanho, mtime e inode do caminho não mudaram desde o último
+        processamento, reutiliza o hash registrado no cache. Livros
+        exportados pelo kindle_finder trazem o hash calculado durante a
+        cópia em um sidecar, válido enquanto a assinatura de stat bater.
+        """
+        path = os.path.abspath(filepath)
+        signature = stat_signature(path)
+        
+        indexed = self.cache.find_source(path)
+        if indexed and indexed[1] == signature:
+            return indexed[0]
+        memo = self._hashes.get(path)
+        if memo and memo[0] == signature:
+            return memo[1]
+        
+        algorithm = self.config["hash_algorithm"]
+        algorithms = [algorithm]
+        # Entradas antigas (sem "hash_algorithm") usam MD5: calcula os dois
+        # hashes na mesma leitura e migra a entrada para a nova chave
+        if algorithm != "md5" and self.cache.has_legacy_entries():
+            algorithms.append("md5")
+        
+        sidecar = read_sidecar(path, algorithm) if len(algorithms) == 1 else None
+        if sidecar is not None:
+            digests = {algorithm: sidecar["hash"]}
+        else:
+            digests = file_digests(path, algorithms)
+        file_hash = digests[algorithm]
+        self._hashes[path] = (signature, file_hash)
+        
+        with self._cache_lock:
+            legacy_hash = digests.get("md5")
+            legacy_entry = self.cache.get(legacy_hash) if legacy_hash else None
+            if (legacy_entry is not None
+                    and "hash_algorithm" not in legacy_entry
+                    and file_hash not in self.cache):
+                self.cache.rekey(legacy_hash, file_hash, algorithm)
+            
+            if file_hash in self.cache:
+                self.cache.add_source(file_hash, path, signature)
+        
+        return file_hash
     
     def is_processed(self, filepath: str) -> bool:
         """Verifica se arquivo já foi processado"""
-        file_hash = self._get_file_hash(filepath)
-        return file_hash in self.processed_cache
+        file_hash = self._resolve_hash(filepath)
+        return file_hash in self.cache
+    
+    @property
+    def compression(self) -> Optional[str]:
+        """Compressão dos arquivos gerados (storage.compression)"""
+        return self.config.get("storage", {}).get("compression")
+    
+    def _text_output_path(self,
+                          input_path: Path,
+                          compressed: bool = True,
+                          file_hash: Optional[str] = None) -> Path:
+        """
+        Caminho do arquivo de texto gerado para o livro
+        
+        Com o hash, o nome leva um prefixo dele: livros diferentes com o
+        mesmo nome (a/livro.epub e b/livro.epub, X.azw3 e X.mobi) não
+        disputam a mesma saída quando convertidos em paralelo.
+        """
+        output_dir = Path(self.config["output_dir"]).expanduser()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{input_path.stem}-{file_hash[:OUTPUT_HASH_CHARS]}" if file_hash else input_path.stem
+        output_file = output_dir / f"{stem}.txt"
+        if compressed:
+            output_file = Path(with_compression(str(output_file), self.compression))
+        return output_file
+    
+    def _partial_path(self, output_file: Path) -> Path:
+        """
+        Arquivo temporário de uma saída, publicado com os.replace ao final
+        
+        O prefixo preserva as extensões (o Calibre escolhe o formato por
+        elas e a compressão é inferida pelo sufixo). Pid e thread no nome
+        tornam o arquivo exclusivo da tentativa: dois workers nunca
+        escrevem no mesmo parcial.
+        """
+        return output_file.with_name(
+            f"{PARTIAL_PREFIX}{os.getpid()}-{threading.get_ident()}-{output_file.name}"
+        )
+    
+    def _discard_partials(self, input_path: Path, file_hash: Optional[str] = None):
+        """
+        Apaga saídas parciais deixadas por conversões interrompidas do livro
+        
+        Remove as de qualquer tentativa: só deve ser chamado com o lease
+        do livro (ver _discard_interrupted).
+        """
+        for compressed in (True, False):
+            output_file = self._text_output_path(input_path, compressed, file_hash)
+            pattern = re.compile(
+                rf"{re.escape(PARTIAL_PREFIX)}(\d+-\d+-)?{re.escape(output_file.name)}"
+            )
+            with os.scandir(output_file.parent) as entries:
+                partials = [entry.path for entry in entries if pattern.fullmatch(entry.name)]
+            for partial in partials:
+                try:
+                    os.remove(partial)
+                except FileNotFoundError:
+                    continue
+                logger.info(f"Saída parcial removida: {partial}")
+    
+    def _discard_interrupted(self, input_path: Path, file_hash: Optional[str]):
+        """
+        Apaga as saídas parciais de uma conversão interrompida
+        
+        Só com o lease do livro: se outro processo o está convertendo,
+        as saídas parciais são dele.
+        """
+        if not file_hash:
+            try:
+                file_hash = self._resolve_hash(str(input_path))
+            except OSError:
+                return
+        if not self.cache.claim(file_hash, self.config["claim_ttl_seconds"]):
+            logger.info(f"Conversão em andamento em outro processo: {input_path.name}")
+            return
+        try:
+            self._discard_partials(input_path, file_hash)
+        finally:
+            self.cache.release(file_hash)
+    
+    @contextmanager
+    def _partial_output(self, input_path: Path, file_hash: Optional[str] = None):
+        """Em caso de erro no bloco, remove as saídas parciais desta tentativa"""
+        try:
+            yield
+        except BaseException:
+            for compressed in (True, False):
+                partial = self._partial_path(self._text_output_path(input_path, compressed, file_hash))
+                if partial.exists():
+                    partial.unlink()
+            raise
+    
+    def _derived_path(self, text_file: str, suffix: str) -> str:
+        """Arquivo derivado do texto (requisição, chunks), com a mesma compressão"""
+        base = Path(strip_compression(text_file)).with_suffix(suffix)
+        return with_compression(str(base), self.compression)
+    
+    def extract_native(self,
+                       input_file: str,
+                       file_hash: Optional[str] = None) -> Optional[Tuple[Dict[str, str], str]]:
+        """
+        Extrai metadados e texto sem Calibre (EPUB sem DRM)
+        
+        Args:
+            input_file: Caminho do arquivo de entrada
+            file_hash: Hash do conteúdo, para o nome da saída
+            
+        Returns:
+            (metadados, caminho do texto) ou None se o arquivo precisar
+            ser convertido pelo Calibre
+        """
+        from epub_extractor import EpubError, EpubExtractor
+        
+        input_path = Path(input_file)
+        output_file = self._text_output_path(input_path, file_hash=file_hash)
+        
+        logger.info(f"Extraindo nativamente: {input_path.name}")
+        
+        partial = self._partial_path(output_file)
+        try:
+            with self._partial_output(input_path, file_hash), EpubExtractor(input_file) as epub:
+                epub.write_text(str(partial))
+                metadata = epub.metadata
+        except EpubError as e:
+            logger.warning(f"Extração nativa falhou ({e}), usando Calibre")
+            return None
+        os.replace(partial, output_file)
+        
+        logger.info(f"Extração concluída: {output_file}")
+        return metadata, str(output_file)
     
-    def convert_to_text(self, input_file: str) -> str:
+    def convert_to_text(self, input_file: str, file_hash: Optional[str] = None) -> str:
         """
         Converte arquivo Kindle para texto
         
         Args:
             input_file: Caminho do arquivo de entrada
+            file_hash: Hash do conteúdo, para o nome da saída
             
         Returns:
             Caminho do arquivo de texto convertido
         """
-        input_path = Path(input_file)
-        output_dir = Path(self.config["output_dir"]).expanduser()
-        output_dir.mkdir(parents=True, exist_ok=True)
+        if self.calibre_path is None:
+            raise FileNotFoundError(
+                "Calibre não encontrado. Instale em: https://calibre-ebook.com"
+            )
         
-        output_file = output_dir / f"{input_path.stem}.txt"
+        import subprocess
+        
+        input_path = Path(input_file)
+        # O Calibre escolhe o formato pela extensão: comprime depois
+        partial = self._partial_path(self._text_output_path(input_path, False, file_hash))
+        text_file = self._text_output_path(input_path, file_hash=file_hash)
         
         # Comando Calibre
         cmd = [
             self.calibre_path,
             str(input_path),
-            str(output_file)
+            str(partial)
         ] + self.config["calibre_options"]
         
         logger.info(f"Convertendo: {input_path.name}")
         
-        try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
+        with self._partial_output(input_path, file_hash):
+            try:
+                run_subprocess(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Erro na conversão: {e.stderr}")
+                raise
+            
+            os.replace(compress_file(str(partial), self.compression), text_file)
+        
+        logger.info(f"Conversão concluída: {text_file}")
+        return str(text_file)
+    
+    def _calibre_tool(self, name: str) -> str:
+        """Caminho de outra ferramenta do Calibre ao lado do ebook-convert"""
+        calibre = Path(self.calibre_path)
+        if calibre.parent == Path("."):
+            return name
+        return str(calibre.with_name(name + calibre.suffix))
+    
+    def convert_with_metadata(self,
+                              input_file: str,
+                              file_hash: Optional[str] = None) -> Tuple[Dict[str, str], str]:
+        """
+        Converte para texto e lê metadados com um único processo do Calibre
+        
+        O ebook-convert gera um TXTZ (zip com o texto e um metadata.opf),
+        evitando a chamada separada ao ebook-meta.
+        
+        Args:
+            input_file: Caminho do arquivo de entrada
+            file_hash: Hash do conteúdo, para o nome da saída
+            
+        Returns:
+            (metadados, caminho do arquivo de texto convertido)
+        """
+        if self.calibre_path is None:
+            raise FileNotFoundError(
+                "Calibre não encontrado. Instale em: https://calibre-ebook.com"
             )
-            logger.info(f"Conversão concluída: {output_file}")
-            return str(output_file)
+        
+        import subprocess
+        import tempfile
+        import zipfile
+        import xml.etree.ElementTree as ET
+        from epub_extractor import parse_opf_metadata
+        
+        input_path = Path(input_file)
+        output_file = self._text_output_path(input_path, file_hash=file_hash)
+        
+        logger.info(f"Convertendo: {input_path.name}")
+        
+        with tempfile.TemporaryDirectory(prefix="kindle_txtz_") as tmp_dir:
+            txtz_file = Path(tmp_dir) / f"{input_path.stem}.txtz"
+            cmd = [
+                self.calibre_path,
+                str(input_path),
+                str(txtz_file)
+            ] + self.config["calibre_options"]
             
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Erro na conversão: {e.stderr}")
-            raise
+            try:
+                run_subprocess(cmd, capture_output=True, text=True, check=True)
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Erro na conversão: {e.stderr}")
+                raise
+            
+            with zipfile.ZipFile(txtz_file) as txtz:
+                names = txtz.namelist()
+                text_name = "index.txt" if "index.txt" in names else next(
+                    (name for name in names if name.endswith(".txt")), None
+                )
+                if text_name is None:
+                    raise RuntimeError(f"TXTZ sem texto: {input_path.name}")
+                
+                partial = self._partial_path(output_file)
+                with self._partial_output(input_path, file_hash):
+                    with txtz.open(text_name) as src, open_binary(str(partial), "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    os.replace(partial, output_file)
+                
+                metadata = {}
+                if "metadata.opf" in names:
+                    with txtz.open("metadata.opf") as f:
+                        metadata = parse_opf_metadata(ET.parse(f).getroot())
+        
+        logger.info(f"Conversão concluída: {output_file}")
+        return metadata, str(output_file)
     
     def extract_metadata(self, input_file: str) -> Dict[str, str]:
         """Extrai metadados do livro usando Calibre"""
         cmd = [
-            self.calibre_path.replace("ebook-convert", "ebook-meta"),
+            self._calibre_tool("ebook-meta"),
             input_file
         ]
         
         try:
-            result = subprocess.run(
+            result = run_subprocess(
                 cmd,
                 capture_output=True,
                 text=True,
@@ -182,7 +542,8 @@ class KindleProcessor:
     def process_book(self, 
                     input_file: str, 
                     category: str = "general",
-                    force: bool = False) -> Dict[str, Any]:
+                    force: bool = False,
+                    metrics: Optional[Metrics] = None) -> Dict[str, Any]:
         """
         Processa um livro completo
         
@@ -190,6 +551,8 @@ class KindleProcessor:
             input_file: Caminho do arquivo Kindle
             category: Categoria do livro (technical, business, fiction, etc)
             force: Forçar reprocessamento mesmo se já existe no cache
+            metrics: Métricas do livro; quem chama lê em metrics.counters
+                se o livro veio do cache ("cached") ou foi convertido ("processed")
             
         Returns:
             Dicionário com resultados do processamento
@@ -203,84 +566,432 @@ class KindleProcessor:
                 f"Formatos aceitos: {self.config['input_formats']}"
             )
         
+        if metrics is None:
+            metrics = Metrics()
+        result = None
+        try:
+            result = self._process_book(input_path, category, force, metrics)
+            return result
+        finally:
+            # Fora do lote, cada livro é persistido imediatamente
+            if not self._in_batch:
+                self.cache.flush()
+            if not metrics.counters:
+                metrics.count("failed")
+            self._export_metrics(input_path, result, metrics)
+    
+    def _export_metrics(self,
+                        input_path: Path,
+                        result: Optional[Dict[str, Any]],
+                        metrics: Metrics):
+        """Acumula as métricas do livro e exporta para os arquivos configurados"""
+        self.metrics.merge(metrics)
+        if self._batch_metrics is not None:
+            self._batch_metrics.merge(metrics)
+        settings = self.config.get("metrics") or {}
+        
+        if settings.get("jsonl_file"):
+            append_jsonl(settings["jsonl_file"], {
+                "type": "book",
+                "file": input_path.name,
+                "hash": result.get("hash") if result else None,
+                **metrics.as_dict()
+            })
+        # No lote, o arquivo do Prometheus é gravado uma vez ao final
+        if settings.get("prometheus_file") and not self._in_batch:
+            write_prometheus(settings["prometheus_file"], self.metrics)
+    
+    def _process_book(self,
+                      input_path: Path,
+                      category: str,
+                      force: bool,
+                      metrics: Metrics) -> Dict[str, Any]:
+        """Consulta o cache e processa o livro se necessário"""
         # Verificar cache
-        file_hash = self._get_file_hash(input_file)
-        if not force and file_hash in self.processed_cache:
+        with metrics.stage("hash"):
+            file_hash = self._resolve_hash(str(input_path))
+            cached = None if force else self.cache.get(file_hash)
+        if cached is not None:
             logger.info(f"Livro já processado: {input_path.name}")
-            return self.processed_cache[file_hash]
+            metrics.count("cached")
+            return cached
         
+        # Arquivos idênticos no mesmo lote são convertidos uma única vez
+        with self._cache_lock:
+            hash_lock = self._hash_locks.setdefault(file_hash, threading.Lock())
+        
+        with hash_lock:
+            # Outro processo pode estar convertendo o mesmo livro: aguarda
+            # o resultado dele ou o fim do lease antes de converter
+            waiting = False
+            with metrics.stage("claim"):
+                while True:
+                    cached = None if force else self.cache.get(file_hash)
+                    if cached is not None:
+                        logger.info(f"Livro já processado: {input_path.name}")
+                        metrics.count("cached")
+                        return cached
+                    if self.cache.claim(file_hash, self.config["claim_ttl_seconds"]):
+                        break
+                    if not waiting:
+                        logger.info(f"Livro em processamento por outro worker: {input_path.name}")
+                        waiting = True
+                    time.sleep(self.config["claim_poll_seconds"])
+            
+            try:
+                cached = None if force else self.cache.get(file_hash)
+                if cached is not None:
+                    metrics.count("cached")
+                    return cached
+                if self._batch_journal is not None:
+                    from batch_journal import CONVERTING
+                    self._batch_journal.record(str(input_path), CONVERTING, hash=file_hash)
+                result = self._process_uncached(input_path, file_hash, category, metrics)
+                metrics.count("processed")
+                return result
+            finally:
+                self.cache.release(file_hash)
+    
+    def _process_uncached(self,
+                          input_path: Path,
+                          file_hash: str,
+                          category: str,
+                          metrics: Metrics) -> Dict[str, Any]:
+        """Extrai, converte e registra um livro que não está no cache"""
+        input_file = str(input_path)
         logger.info(f"Processando: {input_path.name}")
         
-        # Extrair metadados
-        metadata = self.extract_metadata(input_file)
-        
-        # Converter para texto
-        text_file = self.convert_to_text(input_file)
-        
-        # Ler conteúdo
-        with open(text_file, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Preparar resultado
-        result = {
-            "file": input_path.name,
-            "hash": file_hash,
-            "metadata": metadata,
-            "category": category,
-            "processed_at": datetime.now().isoformat(),
-            "text_file": text_file,
-            "content_preview": content[:500] + "...",
-            "content_length": len(content),
-            "status": "ready_for_agent"
-        }
+        extracted = None
+        if input_path.suffix.lower() in self.config.get("native_formats", []):
+            with metrics.stage("native"):
+                extracted = self.extract_native(input_file, file_hash)
+        
+        if extracted:
+            metadata, text_file = extracted
+        elif self.config.get("calibre_single_pass", True):
+            with metrics.stage("convert"):
+                metadata, text_file = self.convert_with_metadata(input_file, file_hash)
+        else:
+            # Extrair metadados
+            with metrics.stage("metadata"):
+                metadata = self.extract_metadata(input_file)
+            
+            # Converter para texto
+            with metrics.stage("convert"):
+                text_file = self.convert_to_text(input_file, file_hash)
         
-        # Salvar no cache
-        self.processed_cache[file_hash] = result
-        self._save_cache()
+        # Mesmo livro já convertido a partir de outro formato ou edição?
+        signature, original, score = None, None, 0.0
+        if self.duplicates is not None:
+            with metrics.stage("fingerprint"):
+                signature, original, score = self._find_duplicate(file_hash, text_file)
+        
+        if original is not None:
+            # Reaproveita o texto já convertido (e, com ele, requisição,
+            # chunks e resumos gerados a partir dele)
+            logger.info(
+                f"{input_path.name} é o mesmo livro que {original['file']} "
+                f"(similaridade {score:.2f}): reaproveitando {original['text_file']}"
+            )
+            if os.path.abspath(text_file) != os.path.abspath(original["text_file"]):
+                os.remove(text_file)
+            result = {
+                key: value for key, value in original.items()
+                if key not in ("sources", "timings", "metrics")
+            }
+            result.update({
+                "file": input_path.name,
+                "hash": file_hash,
+                "hash_algorithm": self.config["hash_algorithm"],
+                "metadata": metadata or original.get("metadata", {}),
+                "category": category,
+                "processed_at": datetime.now().isoformat(),
+                "duplicate_of": original["hash"],
+                "similarity": round(score, 3),
+            })
+        else:
+            # Ler conteúdo
+            with metrics.stage("read"):
+                preview, content_length = self._text_stats(text_file)
+            
+            # Preparar resultado
+            result = {
+                "file": input_path.name,
+                "hash": file_hash,
+                "hash_algorithm": self.config["hash_algorithm"],
+                "metadata": metadata,
+                "category": category,
+                "processed_at": datetime.now().isoformat(),
+                "text_file": text_file,
+                "content_preview": preview + "...",
+                "content_length": content_length,
+                "status": "ready_for_agent"
+            }
+        result["timings"] = metrics.timings()
+        result["metrics"] = metrics.as_dict()["stages"]
         
-        # Mover arquivo processado
-        if self.config.get("move_processed", True):
-            processed_dir = Path(self.config["processed_dir"]).expanduser()
-            processed_dir.mkdir(parents=True, exist_ok=True)
+        with metrics.stage("cache"), self._cache_lock:
+            source_path = os.path.abspath(input_file)
+            self.cache.put(file_hash, result)
+            if signature is not None and original is None:
+                self.duplicates.add(file_hash, signature)
             
-            new_path = processed_dir / input_path.name
-            if not new_path.exists():
-                os.rename(input_file, new_path)
-                logger.info(f"Arquivo movido para: {new_path}")
+            # Mover arquivo processado
+            if self.config.get("move_processed", True):
+                processed_dir = Path(self.config["processed_dir"]).expanduser()
+                processed_dir.mkdir(parents=True, exist_ok=True)
+                
+                new_path = processed_dir / input_path.name
+                if not new_path.exists():
+                    os.rename(input_file, new_path)
+                    # O sidecar da exportação vai junto, senão fica órfão na entrada
+                    move_sidecar(input_file, str(new_path))
+                    self.cache.remove_source(source_path)
+                    source_path = os.path.abspath(new_path)
+                    logger.info(f"Arquivo movido para: {new_path}")
+            
+            # Registrar stat do arquivo para pular o hash na próxima execução
+            self.cache.add_source(file_hash, source_path, stat_signature(source_path))
+            
+            # Publicar antes de liberar o lease, para outros processos verem
+            self.cache.flush()
+        
+        # O registro já gravado no cache fica sem a etapa "cache"
+        result["timings"] = metrics.timings()
+        result["metrics"] = metrics.as_dict()["stages"]
+        logger.info(
+            f"Tempos de {input_path.name}: " +
+            ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in result["timings"].items())
+        )
         
         return result
     
+    def _find_duplicate(self,
+                        file_hash: str,
+                        text_file: str) -> Tuple[Optional[list], Optional[Dict[str, Any]], float]:
+        """
+        Procura no índice MinHash um livro já processado com o mesmo texto
+        
+        Returns:
+            (assinatura do texto, entrada do cache do livro original ou
+            None, similaridade estimada)
+        """
+        from near_duplicates import SAMPLE_CHARS, file_signature
+        
+        sample_chars = (self.config.get("near_duplicates") or {}).get("sample_chars", SAMPLE_CHARS)
+        signature = file_signature(text_file, sample_chars)
+        if signature is None:
+            return None, None, 0.0
+        
+        for match_hash, score in self.duplicates.query(signature):
+            if match_hash == file_hash:
+                continue
+            entry = self.cache.get(match_hash)
+            # O original precisa estar no cache e com o texto ainda em disco
+            if entry is not None and os.path.exists(entry.get("text_file", "")):
+                return signature, entry, score
+        return signature, None, 0.0
+    
+    def _text_stats(self, text_file: str) -> Tuple[str, int]:
+        """Prévia e tamanho (em caracteres) do texto, lido em blocos"""
+        with open_text(text_file, errors='ignore') as f:
+            preview = f.read(500)
+            length = len(preview)
+            for block in iter(lambda: f.read(1024 * 1024), ''):
+                length += len(block)
+        return preview, length
+    
     def batch_process(self, 
                      input_dir: str,
                      category: str = "general",
-                     recursive: bool = True) -> list:
+                     recursive: bool = True,
+                     workers: Optional[int] = None,
+                     resume: bool = True,
+                     retry_failed: bool = False) -> list:
         """
         Processa múltiplos livros de um diretório
         
+        A conversão roda em subprocessos do Calibre, então um pool de
+        threads basta para ocupar vários núcleos ao mesmo tempo.
+        
+        O progresso é registrado em um diário (BatchJournal): se o lote
+        anterior foi interrompido, a lista de arquivos vem do diário, os
+        concluídos são pulados sem recalcular o hash e as saídas parciais
+        de conversões interrompidas são apagadas antes de refazê-las.
+        Só as conversões vão para o diário; livros já em cache são
+        reconhecidos de novo pelo stat, sem um fsync por livro. Se outro
+        processo está com um lote do mesmo diretório, este segue sem
+        diário, coordenado com o outro apenas pelos leases do cache.
+        
         Args:
             input_dir: Diretório com arquivos Kindle
             category: Categoria padrão dos livros
             recursive: Buscar em subdiretórios
+            workers: Número de conversões simultâneas (padrão: config
+                "max_workers" ou número de CPUs)
+            resume: Retomar o lote interrompido, se houver
+            retry_failed: Reprocessar os arquivos que falharam no último
+                lote (sem lote interrompido, processa só esses arquivos)
             
         Returns:
-            Lista de resultados processados
+            Lista de resultados processados, na ordem dos caminhos
         """
+        from batch_journal import BatchJournal, CONVERTING, DONE, FAILED
+        
         input_path = Path(input_dir).expanduser()
-        results = []
+        # Etapas do lote em si; as dos livros são somadas em _batch_metrics
+        batch = Metrics()
+        batch_started = time.perf_counter()
         
-        # Buscar arquivos
-        pattern = "**/*" if recursive else "*"
-        for file_path in input_path.glob(pattern):
-            if file_path.suffix.lower() in self.config["input_formats"]:
-                try:
-                    result = self.process_book(str(file_path), category)
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"Erro processando {file_path}: {e}")
+        journal = None
+        if self.config.get("batch_journal", True):
+            journal = BatchJournal.for_directory(self.config["journal_dir"], str(input_path))
+            if not journal.acquire():
+                logger.warning(
+                    f"Outro processo está com um lote de {input_path} em andamento: "
+                    "seguindo sem diário"
+                )
+                journal = None
+        
+        with batch.stage("discover"):
+            if journal and resume and journal.resumable:
+                files = [Path(path) for path in journal.files]
+                logger.info(
+                    f"Retomando lote interrompido: {len(journal.with_state(DONE))} de "
+                    f"{len(files)} arquivos já concluídos"
+                )
+            elif journal and retry_failed:
+                files = [Path(path) for path in journal.with_state(FAILED)]
+                logger.info(f"Reprocessando {len(files)} arquivos que falharam no último lote")
+            else:
+                if journal:
+                    journal.clear()
+                # Buscar arquivos (ordenados para resultado determinístico)
+                pattern = "**/*" if recursive else "*"
+                files = []
+                for file_path in input_path.glob(pattern):
+                    target = sidecar_target(str(file_path))
+                    if target is not None:
+                        # Sidecar de um livro que não está mais aqui
+                        if not os.path.exists(target):
+                            file_path.unlink(missing_ok=True)
+                        continue
+                    if (file_path.suffix.lower() in self.config["input_formats"]
+                            # Exportação do kindle_finder ainda em andamento
+                            and not file_path.name.startswith(PARTIAL_PREFIX)):
+                        files.append(file_path)
+                files.sort()
+        
+        # Resultados de arquivos já concluídos vêm do cache pelo hash do diário
+        known: Dict[str, Optional[Dict[str, Any]]] = {}
+        if journal:
+            for file_path in files:
+                path = str(file_path)
+                state = journal.state(path)
+                if state == DONE:
+                    cached = self.cache.get(journal.entries[path].get("hash", ""))
+                    if cached is not None:
+                        known[path] = cached
+                elif state == FAILED and not retry_failed:
+                    known[path] = None
+                elif state == CONVERTING:
+                    # Interrompido no meio da conversão: descarta a saída parcial
+                    self._discard_interrupted(file_path, journal.entries[path].get("hash"))
+            journal.start(str(input_path), category, [str(file_path) for file_path in files])
+        pending = [file_path for file_path in files if str(file_path) not in known]
+        
+        if workers is None:
+            workers = self.config.get("max_workers") or os.cpu_count() or 1
+        workers = max(1, min(workers, len(pending) or 1))
+        
+        def process(file_path: Path) -> Optional[Dict[str, Any]]:
+            path = str(file_path)
+            try:
+                result = self.process_book(path, category)
+            except Exception as e:
+                logger.error(f"Erro processando {file_path}: {e}")
+                if journal:
+                    journal.record(path, FAILED, error=f"{type(e).__name__}: {e}")
+                return None
+            # CONVERTING é registrado em _process_book; acertos de cache sem
+            # estado anterior no diário não precisam de registro
+            if journal and path in journal.entries:
+                journal.record(path, DONE, hash=result["hash"])
+            return result
+        
+        self._in_batch = True
+        self._batch_metrics = Metrics()
+        self._batch_journal = journal
+        try:
+            if workers == 1:
+                outcomes = [process(file_path) for file_path in pending]
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                
+                logger.info(f"Processando {len(pending)} arquivos com {workers} workers")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    outcomes = list(executor.map(process, pending))
+            
+            processed = dict(zip((str(file_path) for file_path in pending), outcomes))
+            outcomes = [
+                known[str(file_path)] if str(file_path) in known else processed[str(file_path)]
+                for file_path in files
+            ]
+            if journal:
+                journal.finish()
+        finally:
+            if journal:
+                journal.close()
+            self._in_batch = False
+            self._batch_journal = None
+            with batch.stage("flush"):
+                self.cache.flush()
+            batch.add("batch", {"wall_seconds": time.perf_counter() - batch_started})
+            books, self._batch_metrics = self._batch_metrics, None
+            self._export_batch_metrics(input_path, len(files), workers, books, batch)
+        
+        results = [result for result in outcomes if result is not None]
         
         logger.info(f"Processados {len(results)} livros")
         return results
     
+    def _export_batch_metrics(self,
+                              input_path: Path,
+                              total_files: int,
+                              workers: int,
+                              books: Metrics,
+                              batch: Metrics):
+        """Resume as métricas do lote (livros + etapas do lote) e exporta"""
+        summary = Metrics()
+        summary.merge(books)
+        summary.merge(batch)
+        self.metrics.merge(batch)
+        self.last_batch_metrics = summary.as_dict()
+        
+        counters = self.last_batch_metrics["counters"]
+        stages = self.last_batch_metrics["stages"]
+        logger.info(
+            f"Lote: {total_files} arquivos em {stages['batch']['wall_seconds']:.2f}s "
+            f"({counters.get('processed', 0)} processados, {counters.get('cached', 0)} em cache, "
+            f"{counters.get('failed', 0)} com erro); "
+            + ", ".join(
+                f"{name}={stage['wall_seconds']:.2f}s" for name, stage in stages.items()
+                if name != "batch"
+            )
+        )
+        
+        settings = self.config.get("metrics") or {}
+        if settings.get("jsonl_file"):
+            append_jsonl(settings["jsonl_file"], {
+                "type": "batch",
+                "input_dir": str(input_path),
+                "files": total_files,
+                "workers": workers,
+                **self.last_batch_metrics
+            })
+        if settings.get("prometheus_file"):
+            write_prometheus(settings["prometheus_file"], self.metrics)
+    
     def clean_text(self, text: str) -> str:
         """
         Limpa e normaliza texto extraído
@@ -291,32 +1002,7 @@ class KindleProcessor:
         Returns:
             Texto limpo e formatado
         """
-        import re
-        
-        # Remover múltiplas quebras de linha
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        
-        # Remover espaços extras
-        text = re.sub(r'[ \t]+', ' ', text)
-        
-        # Remover caracteres de controle
-        text = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
-        
-        # Remover linhas de cabeçalho/rodapé repetitivas
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for i, line in enumerate(lines):
-            # Pular linhas que parecem números de página
-            if re.match(r'^\s*\d+\s*$', line):
-                continue
-            # Pular linhas muito curtas repetitivas
-            if len(line.strip()) < 5 and i > 0 and i < len(lines)-1:
-                if lines[i-1].strip() == line.strip():
-                    continue
-            cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
+        return clean_text(text)
     
     def generate_summary_request(self, 
                                 text_file: str,
@@ -333,14 +1019,17 @@ class KindleProcessor:
         Returns:
             Dicionário com dados para o agente
         """
-        with open(text_file, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Limpar texto
-        content = self.clean_text(content)
+        # Limpar texto linha a linha, sem manter o texto bruto em memória
+        with open_text(text_file, errors='ignore') as f:
+            content = '\n'.join(iter_clean_lines(iter_file_lines(f)))
         
+        return dict(self._summary_request_header(metadata, category), content=content)
+    
+    def _summary_request_header(self,
+                                metadata: Dict[str, str],
+                                category: str) -> Dict[str, Any]:
+        """Campos da requisição para o agente, exceto o conteúdo"""
         return {
-            "content": content,
             "metadata": {
                 "title": metadata.get("Title", "Unknown"),
                 "author": metadata.get("Author(s)", "Unknown"),
@@ -351,6 +1040,103 @@ class KindleProcessor:
             "config": self.config["agente_config"],
             "request_type": "full_analysis"
         }
+    
+    def write_summary_request(self,
+                              text_file: str,
+                              metadata: Dict[str, str],
+                              category: str,
+                              request_file: Optional[str] = None,
+                              force: bool = False) -> str:
+        """
+        Grava a requisição para o agente em streaming
+        
+        O texto é lido, limpo e escrito linha a linha, então a memória
+        usada não depende do tamanho do livro. Uma requisição já gravada,
+        mais nova que o texto e com o mesmo cabeçalho, é reaproveitada.
+        
+        Args:
+            text_file: Caminho do arquivo de texto
+            metadata: Metadados do livro
+            category: Categoria do livro
+            request_file: Destino (padrão: <texto>.agent_request.json[.gz])
+            force: Regravar mesmo se a requisição estiver atualizada
+            
+        Returns:
+            Caminho do arquivo de requisição
+        """
+        if request_file is None:
+            request_file = self._derived_path(text_file, '.agent_request.json')
+        
+        header = self._summary_request_header(metadata, category)
+        if not force and self._request_is_current(request_file, text_file, header):
+            logger.info(f"Requisição já atualizada: {request_file}")
+            return request_file
+        
+        with open_text(text_file, errors='ignore') as f:
+            write_agent_request(
+                request_file,
+                header,
+                iter_clean_lines(iter_file_lines(f))
+            )
+        
+        return request_file
+    
+    def _request_is_current(self,
+                            request_file: str,
+                            text_file: str,
+                            header: Dict[str, Any]) -> bool:
+        """Verifica se a requisição gravada corresponde ao texto e ao cabeçalho"""
+        try:
+            if os.stat(request_file).st_mtime_ns < os.stat(text_file).st_mtime_ns:
+                return False
+        except OSError:
+            return False
+        return read_header(request_file) == dict(header, format=REQUEST_FORMAT)
+    
+    def write_chunks(self,
+                     text_file: str,
+                     metadata: Dict[str, str],
+                     category: str,
+                     chunks_file: Optional[str] = None) -> Tuple[str, int]:
+        """
+        Divide o texto limpo em chunks e grava em JSON Lines
+        
+        Usa chunk_size e chunk_overlap de processing_config. O texto é
+        processado em streaming, linha a linha.
+        
+        Args:
+            text_file: Caminho do arquivo de texto
+            metadata: Metadados do livro
+            category: Categoria do livro
+            chunks_file: Destino (padrão: <texto>.chunks.jsonl[.gz])
+            
+        Returns:
+            (caminho do arquivo de chunks, número de chunks)
+        """
+        from chunker import iter_chunks, write_chunks_file
+        
+        processing = self.config.get("processing_config", {})
+        chunk_size = processing.get("chunk_size", 2000)
+        chunk_overlap = processing.get("chunk_overlap", 200)
+        
+        if chunks_file is None:
+            chunks_file = self._derived_path(text_file, '.chunks.jsonl')
+        
+        header = dict(
+            self._summary_request_header(metadata, category),
+            request_type="chunked_analysis",
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        
+        with open_text(text_file, errors='ignore') as f:
+            total = write_chunks_file(
+                chunks_file,
+                header,
+                iter_chunks(iter_clean_lines(iter_file_lines(f)), chunk_size, chunk_overlap)
+            )
+        
+        return chunks_file, total
 
 
 def main():
@@ -380,22 +1166,59 @@ def main():
         action="store_true",
         help="Processar diretório em lote"
     )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        help="Conversões simultâneas no modo lote (padrão: número de CPUs)"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="No modo lote, reprocessar os arquivos que falharam no último lote"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="No modo lote, ignorar o lote interrompido e começar do zero"
+    )
+    parser.add_argument(
+        "--chunks",
+        action="store_true",
+        help="Gerar também o arquivo de chunks (.chunks.jsonl)"
+    )
     parser.add_argument(
         "--config",
         help="Arquivo de configuração customizado"
     )
+    parser.add_argument(
+        "--metrics-jsonl",
+        help="Acrescentar as métricas por etapa a este arquivo JSON lines"
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        help="Gravar as métricas no formato texto do Prometheus (.prom)"
+    )
     
     args = parser.parse_args()
     
     # Inicializar processador
     processor = KindleProcessor(args.config)
+    metrics_config = dict(processor.config.get("metrics") or {})
+    if args.metrics_jsonl:
+        metrics_config["jsonl_file"] = args.metrics_jsonl
+    if args.metrics_prom:
+        metrics_config["prometheus_file"] = args.metrics_prom
+    processor.config["metrics"] = metrics_config
     
     try:
         if args.batch:
             # Processamento em lote
             results = processor.batch_process(
                 args.input,
-                category=args.category
+                category=args.category,
+                workers=args.workers,
+                resume=not args.no_resume,
+                retry_failed=args.retry_failed
             )
             
             print(f"\nProcessados {len(results)} livros:")
@@ -413,6 +1236,9 @@ def main():
             print(f"Arquivo: {result['file']}")
             print(f"Texto salvo em: {result['text_file']}")
             print(f"Tamanho: {result['content_length']} caracteres")
+            if result.get('duplicate_of'):
+                print(f"Mesmo livro que {result['duplicate_of']} "
+                      f"(similaridade {result['similarity']:.2f}): texto e resumos reaproveitados")
             
             if result['metadata']:
                 print("\nMetadados:")
@@ -420,19 +1246,23 @@ def main():
                     if value and value != "Unknown":
                         print(f"  {key}: {value}")
             
-            # Gerar requisição para o agente
-            agent_request = processor.generate_summary_request(
+            # Gerar e salvar requisição para o agente
+            request_file = processor.write_summary_request(
                 result['text_file'],
                 result['metadata'],
-                args.category
+                args.category,
+                force=args.force
             )
             
-            # Salvar requisição
-            request_file = Path(result['text_file']).with_suffix('.agent_request.json')
-            with open(request_file, 'w', encoding='utf-8') as f:
-                json.dump(agent_request, f, ensure_ascii=False, indent=2)
-            
             print(f"\nRequisição para agente salva em: {request_file}")
+            
+            if args.chunks:
+                chunks_file, total = processor.write_chunks(
+                    result['text_file'],
+                    result['metadata'],
+                    args.category
+                )
+                print(f"Chunks ({total}) salvos em: {chunks_file}")
             print("Use este arquivo com o agente de resumo para gerar a análise completa.")
             
     except Exception as e:
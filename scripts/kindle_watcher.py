@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Monitor da Pasta de Entrada
+Processa automaticamente os livros que chegam em ~/KindleBooks/input,
+usando inotify no Linux e varredura periódica nos demais sistemas
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import select
+import struct
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from instrumentation import Metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INPUT_DIR = "~/KindleBooks/input"
+
+# Nomes usados por cópias ainda em andamento
+TEMP_SUFFIXES = (".part", ".partial", ".crdownload", ".download", ".tmp")
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PollingWatcher:
+    """Detecta arquivos novos ou alterados comparando varreduras"""
+
+    def __init__(self, root: Path, interval: float = 2.0):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = Path(directory) / name
+                signature = _signature(path)
+                if signature is not None:
+                    snapshot[path] = signature
+        return snapshot
+
+    def initial(self) -> List[Path]:
+        return list(self._snapshot)
+
+    def poll(self, timeout: float) -> List[Path]:
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = [
+            path for path, signature in snapshot.items()
+            if self._snapshot.get(path) != signature
+        ]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Recebe eventos do kernel via inotify (Linux), sem dependências externas"""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, root: Path):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+
+        self.root = root
+        self._ctypes = ctypes
+        self._dirs: Dict[int, Path] = {}
+        self._initial: List[Path] = []
+        self._watch_tree(root)
+
+    def _watch(self, directory: Path):
+        wd = self._add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch falhou em {directory}: {os.strerror(errno)}")
+        self._dirs[wd] = directory
+
+    def _watch_tree(self, root: Path) -> List[Path]:
+        """Monitora o diretório e subdiretórios; retorna os arquivos existentes"""
+        found = []
+        for directory, _, names in os.walk(root):
+            self._watch(Path(directory))
+            found.extend(Path(directory) / name for name in names)
+        self._initial.extend(found)
+        return found
+
+    def initial(self) -> List[Path]:
+        found, self._initial = self._initial, []
+        return found
+
+    def poll(self, timeout: float) -> List[Path]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Eventos perdidos: reexamina a árvore inteira
+                    logger.warning("Fila do inotify estourou; reexaminando o diretório")
+                    changed.extend(self._rescan())
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = directory / os.fsdecode(name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.extend(self._watch_tree(path))
+                        self._initial = []
+                else:
+                    changed.append(path)
+        return changed
+
+    def _rescan(self) -> List[Path]:
+        found = self._watch_tree(self.root)
+        self._initial = []
+        return found
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(root: Path, polling: bool = False, interval: float = 2.0):
+    """inotify quando disponível, varredura periódica caso contrário"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify indisponível ({e}); usando varredura periódica")
+    return PollingWatcher(root, interval)
+
+
+class Debouncer:
+    """
+    Só libera um arquivo depois que tamanho e mtime ficam estáveis por
+    "settle_seconds", evitando processar cópias incompletas
+    """
+
+    def __init__(self, settle_seconds: float = 2.0):
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[Path, Tuple[Optional[Tuple[int, int]], float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, path: Path, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        first_seen = self._pending[path][2] if path in self._pending else now
+        self._pending[path] = (_signature(path), now, first_seen)
+
+    def ready(self, now: Optional[float] = None) -> List[Tuple[Path, float]]:
+        """
+        Returns:
+            Lista de (arquivo estável, momento em que foi detectado)
+        """
+        now = time.monotonic() if now is None else now
+        stable = []
+        for path, (signature, changed_at, first_seen) in list(self._pending.items()):
+            current = _signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                self._pending[path] = (current, now, first_seen)
+            elif now - changed_at >= self.settle_seconds:
+                del self._pending[path]
+                stable.append((path, first_seen))
+        return stable
+
+
+class KindleWatcher:
+    """
+    Monitora a pasta de entrada e processa cada livro que chega
+
+    Um único KindleProcessor (com cache e Calibre já inicializados) é
+    compartilhado por um pool fixo de threads.
+    """
+
+    def __init__(self,
+                 processor,
+                 input_dir: str = DEFAULT_INPUT_DIR,
+                 category: str = "general",
+                 workers: int = 2,
+                 settle_seconds: float = 2.0,
+                 poll_interval: float = 2.0,
+                 polling: bool = False,
+                 stats_file: Optional[str] = None,
+                 stats_interval: float = 30.0):
+        self.processor = processor
+        self.input_dir = Path(input_dir).expanduser()
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.category = category
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.polling = polling
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        self.debouncer = Debouncer(settle_seconds)
+
+        # Pastas do próprio processador não devem gerar novos eventos
+        self._excluded = [
+            Path(processor.config[key]).expanduser()
+            for key in ("processed_dir", "output_dir")
+            if processor.config.get(key)
+        ]
+        self._queue: "queue.Queue[Optional[Tuple[Path, float]]]" = queue.Queue()
+        self._queued: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._in_progress = 0
+        self._counters = {"processed": 0, "cached": 0, "failed": 0}
+        self._latencies: deque = deque(maxlen=500)
+        self._last: Optional[Dict[str, Any]] = None
+
+    def _accepts(self, path: Path) -> bool:
+        if path.name.startswith('.') or path.name.lower().endswith(TEMP_SUFFIXES):
+            return False
+        if path.suffix.lower() not in self.processor.config["input_formats"]:
+            return False
+        return not any(path == excluded or excluded in path.parents for excluded in self._excluded)
+
+    def _offer(self, paths: Iterable[Path]):
+        for path in paths:
+            if self._accepts(path):
+                with self._lock:
+                    if path in self._queued:
+                        continue
+                self.debouncer.touch(path)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, detected_at = item
+            with self._lock:
+                self._in_progress += 1
+            started = time.monotonic()
+            metrics = Metrics()
+            try:
+                self.processor.process_book(str(path), self.category, metrics=metrics)
+                outcome = "cached" if metrics.counters.get("cached") else "processed"
+            except Exception as e:
+                outcome = "failed"
+                logger.error(f"Erro processando {path.name}: {e}")
+            finished = time.monotonic()
+
+            record = {
+                "file": path.name,
+                "outcome": outcome,
+                "wait_seconds": round(started - detected_at, 3),
+                "processing_seconds": round(finished - started, 3),
+                "latency_seconds": round(finished - detected_at, 3),
+            }
+            with self._lock:
+                self._in_progress -= 1
+                self._queued.discard(path)
+                self._counters[outcome] += 1
+                self._latencies.append(record["latency_seconds"])
+                self._last = record
+            logger.info(
+                f"{path.name}: {outcome} em {record['processing_seconds']:.2f}s "
+                f"(latência {record['latency_seconds']:.2f}s, fila {self._queue.qsize()})"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, livros em andamento e latências"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = dict(self._counters)
+            snapshot.update({
+                "queue_depth": self._queue.qsize(),
+                "settling": len(self.debouncer),
+                "in_progress": self._in_progress,
+                "workers": self.workers,
+                "last": self._last,
+            })
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        snapshot["latency_p50_seconds"] = percentile(0.50)
+        snapshot["latency_p95_seconds"] = percentile(0.95)
+        snapshot["latency_max_seconds"] = latencies[-1] if latencies else None
+        return snapshot
+
+    def _write_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"Fila: {stats['queue_depth']} | em andamento: {stats['in_progress']} | "
+            f"processados: {stats['processed']} | falhas: {stats['failed']} | "
+            f"p95: {stats['latency_p95_seconds']}"
+        )
+        if self.stats_file:
+            temp_file = self.stats_file + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(dict(stats, updated_at=time.time()), f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.stats_file)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Monitora até stop() ou Ctrl+C"""
+        watcher = create_watcher(self.input_dir, self.polling, self.poll_interval)
+        logger.info(
+            f"Monitorando {self.input_dir} ({type(watcher).__name__}, "
+            f"{self.workers} workers)"
+        )
+        threads = [
+            threading.Thread(target=self._worker, name=f"kindle-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Livros que já estavam na pasta antes do monitor iniciar
+        self._offer(watcher.initial())
+        next_stats = time.monotonic() + self.stats_interval
+
+        try:
+            while not self._stop.is_set():
+                timeout = min(self.poll_interval, self.debouncer.settle_seconds / 2) if len(self.debouncer) else self.poll_interval
+                self._offer(watcher.poll(timeout))
+                for path, detected_at in self.debouncer.ready():
+                    with self._lock:
+                        if path in self._queued:
+                            continue
+                        self._queued.add(path)
+                    self._queue.put((path, detected_at))
+                if time.monotonic() >= next_stats:
+                    self._write_stats()
+                    next_stats = time.monotonic() + self.stats_interval
+        except KeyboardInterrupt:
+            logger.info("Encerrando monitor...")
+        finally:
+            watcher.close()
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+            self._write_stats()
+
+
+def main():
+    """Interface de linha de comando"""
+    import argparse
+    from kindle_processor import KindleProcessor
+
+    parser = argparse.ArgumentParser(
+        description="Monitora a pasta de entrada e processa os livros que chegarem"
+    )
+    parser.add_argument(
+        "input_dir",
+        nargs="?",
+        default=DEFAULT_INPUT_DIR,
+        help="Pasta monitorada (padrão: ~/KindleBooks/input)"
+    )
+    parser.add_argument(
+        "-c", "--category",
+        default="general",
+        choices=["technical", "business", "fiction", "academic", "self_help", "general"],
+        help="Categoria dos livros"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=2,
+        help="Conversões simultâneas"
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="Segundos sem mudanças antes de processar um arquivo"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Usar varredura periódica em vez de inotify"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="Intervalo da varredura periódica em segundos"
+    )
+    parser.add_argument(
+        "--stats-file",
+        help="Arquivo JSON atualizado com fila e latências"
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=30.0,
+        help="Intervalo entre atualizações das estatísticas"
+    )
+    parser.add_argument(
+        "--config",
+        help="Arquivo de configuração customizado"
+    )
+
+    args = parser.parse_args()
+
+    watcher = KindleWatcher(
+        KindleProcessor(args.config),
+        args.input_dir,
+        category=args.category,
+        workers=args.workers,
+        settle_seconds=args.settle,
+        poll_interval=args.interval,
+        polling=args.poll,
+        stats_file=args.stats_file,
+        stats_interval=args.stats_interval
+    )
+    print(f"👀 Monitorando {watcher.input_dir} (Ctrl+C para sair)")
+    watcher.run()
+
+    stats = watcher.stats()
+    print(f"\n✅ {stats['processed']} processados, {stats['cached']} já no cache, {stats['failed']} falhas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Índice da Biblioteca Kindle
+Índice persistente (SQLite) das pastas de livros e dos metadados do
+book_asset.db, para que o KindleFinder só reescaneie o que mudou
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_INDEX_PATH = "~/.kindle_finder_index.sqlite3"
+
+
+def book_record(asin: str,
+                path: str,
+                fmt: str,
+                size: int,
+                folder: str,
+                metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Livro no formato de KindleFinder.books
+
+    Sem metadados do banco, o título vem do nome do arquivo.
+    """
+    book = {
+        'asin': asin,
+        'path': path,
+        'format': fmt,
+        'size_mb': round(size / 1024 / 1024, 2),
+        'folder': folder
+    }
+    if metadata is not None:
+        book.update(metadata)
+    else:
+        book['title'] = Path(path).stem
+        book['author'] = 'Unknown'
+    return book
+
+
+class LibraryIndex:
+    """
+    Estado da última varredura de cada pasta de conteúdo do Kindle
+
+    - roots: mtime da pasta raiz e do book_asset.db
+    - folders: pastas *_EBOK com o mtime visto na última varredura
+    - books: arquivo principal de cada pasta (caminho, ASIN, tamanho, mtime)
+    - metadata: título/autor/editora lidos do book_asset.db, por ASIN
+
+    Use ":memory:" como caminho para um índice descartável.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS roots (
+            root TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            db_mtime_ns INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS folders (
+            folder TEXT PRIMARY KEY,
+            root TEXT NOT NULL,
+            asin TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS folders_root ON folders(root);
+        CREATE TABLE IF NOT EXISTS books (
+            path TEXT PRIMARY KEY,
+            asin TEXT NOT NULL,
+            root TEXT NOT NULL,
+            folder TEXT NOT NULL,
+            format TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS books_asin ON books(asin);
+        CREATE INDEX IF NOT EXISTS books_folder ON books(folder);
+        CREATE INDEX IF NOT EXISTS books_root ON books(root);
+        CREATE TABLE IF NOT EXISTS metadata (
+            root TEXT NOT NULL,
+            asin TEXT NOT NULL,
+            title TEXT,
+            author TEXT,
+            publisher TEXT,
+            PRIMARY KEY (root, asin)
+        );
+    """
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH):
+        if index_path != ":memory:":
+            path = Path(index_path).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            index_path = str(path)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(
+            index_path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        if index_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Agrupa as alterações de uma varredura em uma única transação"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def root_state(self, root: str) -> Tuple[Optional[int], Optional[int]]:
+        """(mtime da raiz, mtime do book_asset.db) da última varredura"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, db_mtime_ns FROM roots WHERE root = ?", (root,)
+            ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def set_root_state(self, root: str, mtime_ns: int, db_mtime_ns: Optional[int]):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO roots (root, mtime_ns, db_mtime_ns) VALUES (?, ?, ?)",
+                (root, mtime_ns, db_mtime_ns)
+            )
+
+    def folders(self, root: str) -> Dict[str, int]:
+        """Pastas conhecidas da raiz e o mtime de cada uma"""
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT folder, mtime_ns FROM folders WHERE root = ?", (root,)
+            ))
+
+    def replace_folder(self,
+                       root: str,
+                       folder: str,
+                       asin: str,
+                       mtime_ns: int,
+                       book: Optional[Dict[str, Any]]):
+        """
+        Registra o resultado da varredura de uma pasta
+
+        Args:
+            book: Arquivo principal ({"path", "format", "size", "mtime_ns"})
+                ou None se a pasta não tem arquivo de livro
+        """
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO folders (folder, root, asin, mtime_ns) VALUES (?, ?, ?, ?)",
+                (folder, root, asin, mtime_ns)
+            )
+            self.conn.execute("DELETE FROM books WHERE folder = ?", (folder,))
+            if book is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO books (path, asin, root, folder, format, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (book["path"], asin, root, folder, book["format"], book["size"], book["mtime_ns"])
+                )
+
+    def remove_folders(self, folders: List[str]):
+        """Esquece pastas que não existem mais"""
+        with self._lock:
+            self.conn.executemany("DELETE FROM folders WHERE folder = ?", [(f,) for f in folders])
+            self.conn.executemany("DELETE FROM books WHERE folder = ?", [(f,) for f in folders])
+
+    def replace_metadata(self, root: str, metadata: Dict[str, Dict[str, str]]):
+        """Substitui os metadados do book_asset.db de uma raiz"""
+        with self._lock:
+            self.conn.execute("DELETE FROM metadata WHERE root = ?", (root,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO metadata (root, asin, title, author, publisher) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (root, asin, info.get("title"), info.get("author"), info.get("publisher"))
+                    for asin, info in metadata.items()
+                ]
+            )
+
+    def metadata_count(self, root: str) -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM metadata WHERE root = ?", (root,)
+            ).fetchone()[0]
+
+    def metadata(self, root: str) -> Dict[str, Dict[str, str]]:
+        """Metadados do book_asset.db da raiz, por ASIN"""
+        with self._lock:
+            return {
+                asin: {'title': title, 'author': author, 'publisher': publisher}
+                for asin, title, author, publisher in self.conn.execute(
+                    "SELECT asin, title, author, publisher FROM metadata WHERE root = ?", (root,)
+                )
+            }
+
+    def books(self, root: str) -> List[Dict[str, Any]]:
+        """Livros da raiz no formato de KindleFinder.books (ver book_record)"""
+        with self._lock:
+            rows = self.conn.execute(
+                """SELECT b.asin, b.path, b.format, b.size, b.folder,
+                          m.asin IS NOT NULL, m.title, m.author, m.publisher
+                   FROM books b
+                   LEFT JOIN metadata m ON m.root = b.root AND m.asin = b.asin
+                   WHERE b.root = ?""",
+                (root,)
+            ).fetchall()
+
+        return [
+            book_record(
+                asin, path, fmt, size, folder,
+                {'title': title, 'author': author, 'publisher': publisher} if has_metadata else None
+            )
+            for asin, path, fmt, size, folder, has_metadata, title, author, publisher in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Detecção de Livros Quase Duplicados
+Assinatura MinHash do início do texto extraído e índice LSH em SQLite,
+para reconhecer o mesmo livro em outro formato (.azw, .azw3, .mobi,
+.epub) ou edição e reaproveitar a conversão e os resumos existentes
+"""
+
+import re
+import array
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import open_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = "~/.kindle_processor_minhash.sqlite3"
+NUM_PERM = 128
+BANDS = 32              # 32 bandas de 4 valores: candidatos a partir de ~0,4
+SHINGLE_SIZE = 5        # palavras por shingle
+SAMPLE_CHARS = 50000    # ~25 páginas do início do livro
+MIN_SHINGLES = 50       # textos menores não têm assinatura confiável
+SEED = 20240901
+MASK64 = (1 << 64) - 1
+
+WORD_RE = re.compile(r"\w+")
+
+
+def _masks(num_perm: int, seed: int = SEED) -> List[int]:
+    # Cada "permutação" é o hash base XOR uma máscara fixa de 64 bits
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(num_perm)]
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Hashes de 64 bits dos shingles de palavras (sem acentos, minúsculas)"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = WORD_RE.findall(text)
+    hashes = set()
+    for i in range(max(0, len(words) - size + 1)):
+        shingle = ' '.join(words[i:i + size]).encode('utf-8')
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'little'))
+    return hashes
+
+
+def minhash(text: str, num_perm: int = NUM_PERM) -> Optional[List[int]]:
+    """
+    Assinatura MinHash do texto
+
+    Returns:
+        Lista de num_perm inteiros, ou None se o texto for curto demais
+    """
+    hashes = shingle_hashes(text)
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    return [min(map(mask.__xor__, hashes)) for mask in _masks(num_perm)]
+
+
+def file_signature(text_file: str,
+                   sample_chars: int = SAMPLE_CHARS,
+                   num_perm: int = NUM_PERM) -> Optional[List[int]]:
+    """Assinatura das primeiras páginas de um texto convertido (comprimido ou não)"""
+    with open_text(text_file, errors='ignore') as f:
+        return minhash(f.read(sample_chars), num_perm)
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimativa da similaridade de Jaccard entre duas assinaturas"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class NearDuplicateIndex:
+    """
+    Índice LSH de assinaturas MinHash, um registro por livro canônico
+
+    A assinatura é dividida em bandas; livros que coincidem em ao menos
+    uma banda são candidatos e a similaridade estimada decide.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS signatures (
+            hash TEXT PRIMARY KEY,
+            signature BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS bands (
+            band INTEGER NOT NULL,
+            bucket BLOB NOT NULL,
+            hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS bands_bucket ON bands(band, bucket);
+        CREATE INDEX IF NOT EXISTS bands_hash ON bands(hash);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self,
+                 index_path: str = DEFAULT_INDEX_PATH,
+                 threshold: float = 0.8,
+                 num_perm: int = NUM_PERM,
+                 bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.index_path = Path(index_path).expanduser()
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(
+            str(self.index_path),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._check_params()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["NearDuplicateIndex"]:
+        """Índice conforme config["near_duplicates"], ou None se desativado"""
+        settings = config.get("near_duplicates") or {}
+        if not settings.get("enabled", True):
+            return None
+        return cls(
+            settings.get("index_db", DEFAULT_INDEX_PATH),
+            threshold=settings.get("threshold", 0.8)
+        )
+
+    def _check_params(self):
+        # Assinaturas com outros parâmetros não são comparáveis: recomeça
+        params = f"{self.num_perm}:{self.bands}:{SHINGLE_SIZE}:{SEED}"
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+            if row and row[0] == params:
+                return
+            if row:
+                logger.warning("Parâmetros do MinHash mudaram: índice de duplicados recriado")
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM signatures")
+            self.conn.execute("DELETE FROM bands")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (params,))
+            self.conn.execute("COMMIT")
+
+    def _buckets(self, signature: List[int]) -> List[Tuple[int, bytes]]:
+        return [
+            (band, array.array('Q', signature[band * self.rows:(band + 1) * self.rows]).tobytes())
+            for band in range(self.bands)
+        ]
+
+    def query(self, signature: List[int]) -> List[Tuple[str, float]]:
+        """
+        Livros indexados parecidos com a assinatura
+
+        Returns:
+            Lista de (hash, similaridade) acima do limiar, do mais parecido
+            ao menos parecido
+        """
+        with self._lock:
+            candidates = set()
+            for band, bucket in self._buckets(signature):
+                candidates.update(
+                    row[0] for row in self.conn.execute(
+                        "SELECT hash FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+                    )
+                )
+            matches = []
+            for book_hash in candidates:
+                row = self.conn.execute(
+                    "SELECT signature FROM signatures WHERE hash = ?", (book_hash,)
+                ).fetchone()
+                if row is None:
+                    continue
+                score = similarity(signature, array.array('Q', row[0]).tolist())
+                if score >= self.threshold:
+                    matches.append((book_hash, score))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def add(self, book_hash: str, signature: List[int]):
+        """Indexa (ou reindexa) a assinatura de um livro"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM bands WHERE hash = ?", (book_hash,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO signatures (hash, signature) VALUES (?, ?)",
+                    (book_hash, array.array('Q', signature).tobytes())
+                )
+                self.conn.executemany(
+                    "INSERT INTO bands (band, bucket, hash) VALUES (?, ?, ?)",
+                    [(band, bucket, book_hash) for band, bucket in self._buckets(signature)]
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def remove(self, book_hash: str):
+        """Remove um livro do índice"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM bands WHERE hash = ?", (book_hash,))
+            self.conn.execute("DELETE FROM signatures WHERE hash = ?", (book_hash,))
+            self.conn.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def main():
+    """Compara textos convertidos entre si ou consulta o índice"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Similaridade MinHash entre textos de livros convertidos"
+    )
+    parser.add_argument(
+        "textos",
+        nargs="+",
+        help="Arquivos de texto (.txt, .txt.gz, .txt.zst)"
+    )
+    parser.add_argument(
+        "--index",
+        help="Consultar também o índice SQLite informado"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.8,
+        help="Similaridade mínima para considerar duplicado"
+    )
+    args = parser.parse_args()
+
+    signatures = {}
+    for text_file in args.textos:
+        signature = file_signature(text_file)
+        if signature is None:
+            print(f"⚠️  Texto curto demais para assinatura: {text_file}")
+            continue
+        signatures[text_file] = signature
+
+    names = list(signatures)
+    for i, first in enumerate(names):
+        for second in names[i + 1:]:
+            score = similarity(signatures[first], signatures[second])
+            status = "🔁" if score >= args.threshold else "  "
+            print(f"{status} {score:.2f}  {Path(first).name} × {Path(second).name}")
+
+    if args.index:
+        index = NearDuplicateIndex(args.index, threshold=args.threshold)
+        print(f"\n📚 Índice com {len(index)} livros")
+        for text_file, signature in signatures.items():
+            for book_hash, score in index.query(signature):
+                print(f"🔁 {score:.2f}  {Path(text_file).name} ≈ {book_hash}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
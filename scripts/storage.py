@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Armazenamento Comprimido
+Leitura e escrita transparentes de arquivos de texto com gzip ou zstd
+"""
+
+import io
+import os
+import gzip
+import shutil
+import logging
+from typing import IO, Optional
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COPY_BUFFER = 1024 * 1024
+
+_zstd_warned = False
+
+
+def _zstandard():
+    """Módulo zstandard (pip install zstandard), se instalado"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_compression(compression: Optional[str]) -> Optional[str]:
+    """
+    Normaliza o valor de storage.compression
+
+    "zstd" sem o pacote zstandard cai para gzip; None, "" e "none"
+    desativam a compressão.
+    """
+    if not compression or compression == "none":
+        return None
+    if compression not in SUFFIXES:
+        raise ValueError(f"Compressão não suportada: {compression}")
+    if compression == "zstd" and _zstandard() is None:
+        global _zstd_warned
+        if not _zstd_warned:
+            logger.warning("zstandard não instalado; usando gzip")
+            _zstd_warned = True
+        return "gzip"
+    return compression
+
+
+def with_compression(path: str, compression: Optional[str]) -> str:
+    """Acrescenta o sufixo da compressão ao caminho (.gz, .zst)"""
+    compression = resolve_compression(compression)
+    path = str(path)
+    if compression is None or path.endswith(SUFFIXES[compression]):
+        return path
+    return path + SUFFIXES[compression]
+
+
+def strip_compression(path: str) -> str:
+    """Remove o sufixo de compressão do caminho, se houver"""
+    path = str(path)
+    for suffix in SUFFIXES.values():
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def suffix_compression(path: str) -> Optional[str]:
+    """Compressão indicada pelo sufixo do caminho (.gz, .zst)"""
+    path = str(path)
+    for compression, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Identifica a compressão pelo sufixo ou, na falta dele, pelo conteúdo"""
+    compression = suffix_compression(path)
+    if compression:
+        return compression
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+    except OSError:
+        return None
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def find_existing(path: str) -> Optional[str]:
+    """Caminho existente para o arquivo, com ou sem compressão"""
+    base = strip_compression(path)
+    for candidate in [str(path), base] + [base + suffix for suffix in SUFFIXES.values()]:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def open_binary(path: str, mode: str = 'rb', compression: Optional[str] = None) -> IO[bytes]:
+    """
+    Abre um arquivo binário descomprimindo/comprimindo em streaming
+
+    Na leitura a compressão é detectada automaticamente; na escrita é a
+    informada em "compression" ou, se omitida, a indicada pelo sufixo.
+    """
+    path = str(path)
+    reading = 'r' in mode
+    if reading:
+        compression = detect_compression(path)
+    else:
+        compression = resolve_compression(compression or suffix_compression(path))
+
+    if compression == "gzip":
+        return gzip.open(path, 'rb' if reading else 'wb', compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"Instale o pacote zstandard para ler {path}")
+        raw = open(path, 'rb' if reading else 'wb')
+        if reading:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=True)
+    return open(path, 'rb' if reading else 'wb')
+
+
+def open_text(path: str,
+              mode: str = 'r',
+              compression: Optional[str] = None,
+              encoding: str = 'utf-8',
+              errors: Optional[str] = None) -> IO[str]:
+    """Versão em texto de open_binary, com a mesma detecção de compressão"""
+    return io.TextIOWrapper(
+        open_binary(path, 'rb' if 'r' in mode else 'wb', compression),
+        encoding=encoding,
+        errors=errors
+    )
+
+
+def compress_file(path: str, compression: Optional[str]) -> str:
+    """
+    Comprime um arquivo existente em streaming e remove o original
+
+    Returns:
+        Caminho final (o original se a compressão estiver desativada)
+    """
+    target = with_compression(path, compression)
+    if target == str(path):
+        return target
+    with open(path, 'rb') as src, open_binary(target, 'wb', compression) as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER)
+    os.remove(path)
+    return target
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cache de Resumos
+Cache endereçado por conteúdo dos resumos gerados pela API, com TTL e
+remoção por tamanho (LRU)
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = "~/.agente_resumo/summary_cache.sqlite3"
+
+
+def text_hash(text: str) -> str:
+    """Hash SHA-256 de um texto"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Cache de resumos chaveado por (hash do texto, hash do template,
+    modelo, temperatura)
+
+    Mudar o prompt ou o modelo invalida apenas as entradas afetadas;
+    chunks cujo texto não mudou continuam sendo reaproveitados.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            size INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS summaries_lru ON summaries(last_used);
+    """
+
+    def __init__(self,
+                 cache_path: str = DEFAULT_CACHE_PATH,
+                 ttl_hours: float = 168,
+                 max_mb: float = 512,
+                 evict_every: int = 50):
+        self.cache_path = Path(cache_path).expanduser()
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(
+            str(self.cache_path),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], cache_path: Optional[str] = None):
+        """
+        Cria o cache a partir de configuracoes/config.json
+
+        Returns:
+            None se processing_config.cache_summaries estiver desativado
+        """
+        processing = config.get("processing_config", {})
+        if not processing.get("cache_summaries", True):
+            return None
+        return cls(
+            cache_path or processing.get("cache_path", DEFAULT_CACHE_PATH),
+            ttl_hours=processing.get("cache_ttl_hours", 168),
+            max_mb=processing.get("cache_max_mb", 512)
+        )
+
+    @staticmethod
+    def key(text_digest: str, template_digest: str, model: str, temperature: float) -> str:
+        """Chave do cache para as entradas de uma requisição"""
+        parts = json.dumps([text_digest, template_digest, model, temperature])
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT created_at, data FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[0] > self.ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE summaries SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, created_at, last_used, size, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(data.encode("utf-8")), data)
+            )
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict()
+
+    def _evict(self):
+        """Remove entradas expiradas e, se preciso, as menos usadas"""
+        self.conn.execute(
+            "DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM summaries"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        removed = 0
+        keys = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM summaries ORDER BY last_used"
+        ):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("DELETE FROM summaries WHERE key = ?", keys)
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self.conn.close()
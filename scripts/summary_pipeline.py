@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+Pipeline de Resumo Progressivo
+Resume os chunks em paralelo e consolida os resumos por capítulo, parte
+e livro (map-reduce), gerando os níveis de summary_types.progressive
+"""
+
+import os
+import json
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dispatcher import SummaryDispatcher, chunk_request
+from storage import find_existing, open_text, strip_compression, suffix_compression, with_compression
+from summary_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MAX_REDUCE_ROUNDS = 5
+
+REDUCE_PROMPT = """Você está consolidando resumos do livro "{titulo}" de {autor}.
+
+Abaixo estão resumos parciais de {escopo}, na ordem em que aparecem no livro:
+
+<resumos>
+{texto}
+</resumos>
+
+{instrucao}"""
+
+INSTRUCTIONS = {
+    "group": (
+        "Combine estes resumos em um único resumo contínuo, sem perder "
+        "conceitos, exemplos ou citações importantes."
+    ),
+    "chapter": (
+        "Escreva o resumo de {escopo} em até {limite} palavras, com a ideia "
+        "principal, os pontos-chave e o exemplo mais relevante."
+    ),
+    "part": (
+        "Escreva um resumo de {escopo} em até {limite} palavras, destacando "
+        "as ideias principais e como os capítulos se conectam."
+    ),
+    "book": (
+        "Escreva um resumo de alto nível do livro inteiro em até {limite} "
+        "palavras: tese central, principais argumentos e aplicações práticas."
+    ),
+}
+
+
+class PipelineError(Exception):
+    """Falha em uma ou mais requisições do pipeline"""
+
+
+class SummaryPipeline:
+    """
+    Map-reduce sobre os chunks de um livro
+
+    Níveis gerados (do mais fino ao mais geral):
+        comprehensive: resumos dos chunks, agrupados por capítulo
+        detailed: resumo de cada capítulo (e de cada parte, se houver)
+        high-level: resumo do livro inteiro
+
+    Cada nível é construído a partir do anterior. Com
+    storage.save_intermediate_summaries, todos os resumos ficam em um
+    manifesto e são reaproveitados quando a entrada não muda.
+    """
+
+    def __init__(self,
+                 config: Dict[str, Any],
+                 dispatcher: SummaryDispatcher,
+                 manifest_file: Optional[str] = None):
+        models = config.get("model_config", {})
+        summary_types = config.get("summary_types", {})
+        storage = config.get("storage", {})
+
+        self.dispatcher = dispatcher
+        self.levels = summary_types.get("progressive", {}).get(
+            "levels", ["high-level", "detailed", "comprehensive"]
+        )
+        self.chapter_limit = summary_types.get("chapter", {}).get("max_length_per_chapter", 150)
+        self.book_limit = summary_types.get("executive", {}).get("max_length", 1000)
+        self.part_limit = self.chapter_limit * 3
+
+        # Estimativa conservadora (~2 caracteres por token) para que a
+        # entrada de cada redução caiba na janela de contexto
+        context_window = models.get("context_window", 180000)
+        max_tokens = models.get("max_tokens", 8192)
+        self.reduce_budget = max(4000, (context_window - max_tokens) * 2)
+
+        self.manifest_file = manifest_file if storage.get("save_intermediate_summaries", True) else None
+        self.previous: Dict[str, Dict[str, Any]] = {}
+        self.summaries: Dict[str, Dict[str, Any]] = {}
+        self.reused = 0
+        self.sent = 0
+        existing = find_existing(self.manifest_file) if self.manifest_file else None
+        if existing:
+            with open_text(existing) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.previous = manifest.get("summaries", {})
+
+    @staticmethod
+    def request_key(request: Dict[str, Any]) -> str:
+        """Chave de um resumo intermediário: texto de entrada e template"""
+        return text_hash(json.dumps([request.get("template", ""), request["text"]], ensure_ascii=False))
+
+    def _save_manifest(self, structure: Dict[str, Any]):
+        if not self.manifest_file:
+            return
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "structure": structure,
+            "summaries": self.summaries,
+        }
+        temp_file = self.manifest_file + ".tmp"
+        with open_text(temp_file, 'w', suffix_compression(self.manifest_file)) as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_file, self.manifest_file)
+
+    async def _run(self, requests: List[Dict[str, Any]], kind: str) -> List[str]:
+        """
+        Resolve requisições, reaproveitando resumos do manifesto
+
+        Returns:
+            Resumos na ordem das requisições
+        """
+        keys = [self.request_key(request) for request in requests]
+        missing = []
+        for key, request in zip(keys, requests):
+            if key in self.summaries:
+                continue
+            if key in self.previous:
+                self.summaries[key] = self.previous[key]
+                self.reused += 1
+            else:
+                missing.append((key, request))
+
+        if missing:
+            logger.info(f"{kind}: {len(missing)} requisições ({len(requests) - len(missing)} reaproveitadas)")
+            results = await self.dispatcher.dispatch(request for _, request in missing)
+            failed = 0
+            for (key, _), result in zip(missing, results):
+                if result["status"] != "ok":
+                    failed += 1
+                    continue
+                self.summaries[key] = {
+                    "kind": kind,
+                    "model": result.get("model"),
+                    "summary": result["summary"],
+                }
+                self.sent += 1
+            if failed:
+                raise PipelineError(f"{failed} requisições de '{kind}' falharam")
+
+        return [self.summaries[key]["summary"] for key in keys]
+
+    def _reduce_request(self,
+                        header: Dict[str, Any],
+                        scope: str,
+                        inputs: List[str],
+                        kind: str,
+                        limit: Optional[int] = None) -> Dict[str, Any]:
+        metadata = header.get("metadata", {})
+        fields = {
+            "titulo": metadata.get("title", "Unknown"),
+            "autor": metadata.get("author", "Unknown"),
+            "escopo": scope,
+        }
+        instrucao = INSTRUCTIONS[kind].format(escopo=scope, limite=limit)
+        text = "\n\n---\n\n".join(inputs)
+        return {
+            "prompt": REDUCE_PROMPT.format(texto=text, instrucao=instrucao, **fields),
+            "text": text,
+            "template": json.dumps([REDUCE_PROMPT, instrucao, fields], ensure_ascii=False),
+        }
+
+    def _group(self, inputs: List[str]) -> List[List[str]]:
+        """Agrupa resumos consecutivos sem ultrapassar o orçamento da redução"""
+        groups: List[List[str]] = []
+        size = 0
+        for item in inputs:
+            if groups and size + len(item) <= self.reduce_budget:
+                groups[-1].append(item)
+                size += len(item)
+            else:
+                groups.append([item])
+                size = len(item)
+        return groups
+
+    async def _reduce_level(self,
+                            header: Dict[str, Any],
+                            nodes: List[Dict[str, Any]],
+                            kind: str,
+                            limit: int) -> List[str]:
+        """
+        Reduz cada nó (lista de resumos) a um único resumo
+
+        Quando os resumos de um nó não cabem em uma requisição, são
+        consolidados em grupos, em rodadas, até caberem.
+        """
+        pending = [node["inputs"] for node in nodes]
+        for _ in range(MAX_REDUCE_ROUNDS):
+            requests = []
+            targets = []
+            for position, inputs in enumerate(pending):
+                groups = self._group(inputs)
+                if len(groups) > 1:
+                    for group in groups:
+                        requests.append(self._reduce_request(header, nodes[position]["scope"], group, "group"))
+                        targets.append(position)
+            if not requests:
+                break
+
+            results = await self._run(requests, "group")
+            regrouped: Dict[int, List[str]] = {}
+            for position, summary in zip(targets, results):
+                regrouped.setdefault(position, []).append(summary)
+            pending = [regrouped.get(position, inputs) for position, inputs in enumerate(pending)]
+
+        requests = [
+            self._reduce_request(header, node["scope"], inputs, kind, limit)
+            for node, inputs in zip(nodes, pending)
+        ]
+        return await self._run(requests, kind)
+
+    async def run(self, header: Dict[str, Any], chunks: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Executa o pipeline completo
+
+        Returns:
+            Dicionário com os níveis do resumo progressivo
+        """
+        chunks = list(chunks)
+        structure: Dict[str, Any] = {
+            "chunks": [
+                {"index": chunk["index"], "chapter": chunk.get("chapter"), "part": chunk.get("part")}
+                for chunk in chunks
+            ]
+        }
+
+        try:
+            # Map: um resumo por chunk
+            chunk_summaries = await self._run(
+                [chunk_request(header, chunk) for chunk in chunks], "chunk"
+            )
+
+            # Reduce 1: capítulos (trechos consecutivos com o mesmo capítulo)
+            chapters: List[Dict[str, Any]] = []
+            for chunk, summary in zip(chunks, chunk_summaries):
+                position = (chunk.get("part"), chunk.get("chapter"))
+                if not chapters or chapters[-1]["position"] != position:
+                    chapters.append({
+                        "position": position,
+                        "part": chunk.get("part"),
+                        "chapter": chunk.get("chapter"),
+                        "scope": chunk.get("chapter") or "trecho inicial (antes do primeiro capítulo)",
+                        "chunks": [],
+                        "inputs": [],
+                    })
+                chapters[-1]["chunks"].append(chunk["index"])
+                chapters[-1]["inputs"].append(summary)
+
+            chapter_summaries = await self._reduce_level(header, chapters, "chapter", self.chapter_limit)
+            structure["chapters"] = [
+                {"part": node["part"], "chapter": node["chapter"], "chunks": node["chunks"]}
+                for node in chapters
+            ]
+
+            # Reduce 2: partes, quando o livro é dividido em partes
+            parts: List[Dict[str, Any]] = []
+            if any(node["part"] for node in chapters):
+                for node, summary in zip(chapters, chapter_summaries):
+                    if not parts or parts[-1]["part"] != node["part"]:
+                        parts.append({
+                            "part": node["part"],
+                            "scope": node["part"] or "abertura do livro",
+                            "inputs": [],
+                        })
+                    parts[-1]["inputs"].append(summary)
+            part_summaries = await self._reduce_level(header, parts, "part", self.part_limit) if parts else []
+            structure["parts"] = [node["part"] for node in parts]
+
+            # Reduce 3: livro inteiro
+            book_inputs = part_summaries or chapter_summaries
+            book_summary = (await self._reduce_level(
+                header, [{"scope": "o livro inteiro", "inputs": book_inputs}], "book", self.book_limit
+            ))[0] if book_inputs else ""
+        finally:
+            self._save_manifest(structure)
+
+        levels = {
+            "comprehensive": [
+                {
+                    "part": node["part"],
+                    "chapter": node["chapter"],
+                    "summaries": node["inputs"],
+                }
+                for node in chapters
+            ],
+            "detailed": {
+                "chapters": [
+                    {"part": node["part"], "chapter": node["chapter"], "summary": summary}
+                    for node, summary in zip(chapters, chapter_summaries)
+                ],
+                "parts": [
+                    {"part": node["part"], "summary": summary}
+                    for node, summary in zip(parts, part_summaries)
+                ],
+            },
+            "high-level": book_summary,
+        }
+
+        return {
+            "metadata": header.get("metadata", {}),
+            "levels": {level: levels[level] for level in self.levels if level in levels},
+            "stats": {
+                "chunks": len(chunks),
+                "chapters": len(chapters),
+                "parts": len(parts),
+                "requests_sent": self.sent,
+                "summaries_reused": self.reused,
+            },
+        }
+
+
+def render_markdown(result: Dict[str, Any]) -> str:
+    """Converte o resultado do pipeline em Markdown, do geral ao detalhado"""
+    metadata = result.get("metadata", {})
+    levels = result["levels"]
+    lines = [f"# {metadata.get('title', 'Resumo')}", ""]
+    if metadata.get("author"):
+        lines += [f"*{metadata['author']}*", ""]
+
+    for level, content in levels.items():
+        if level == "high-level":
+            lines += ["## Visão Geral", "", content, ""]
+        elif level == "detailed":
+            lines += ["## Resumo por Capítulo", ""]
+            part_summaries = {node["part"]: node["summary"] for node in content["parts"]}
+            current_part = None
+            for node in content["chapters"]:
+                if node["part"] != current_part and node["part"] in part_summaries:
+                    current_part = node["part"]
+                    lines += [f"### {current_part}", "", part_summaries[current_part], ""]
+                lines += [f"#### {node['chapter'] or 'Introdução'}", "", node["summary"], ""]
+        elif level == "comprehensive":
+            lines += ["## Resumo Completo", ""]
+            for node in content:
+                lines += [f"### {node['chapter'] or 'Introdução'}", ""]
+                for summary in node["summaries"]:
+                    lines += [summary, ""]
+
+    return '\n'.join(lines)
+
+
+def recent_snapshots(output_dir: Path, limit: int = 3) -> List[str]:
+    """Textos salvos de outros livros no mesmo diretório base, mais recentes primeiro"""
+    snapshots = []
+    for directory in output_dir.parent.iterdir() if output_dir.parent.is_dir() else []:
+        if directory != output_dir and directory.is_dir():
+            snapshot = find_existing(str(directory / "fonte.md"))
+            if snapshot:
+                snapshots.append(snapshot)
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    return snapshots[:limit]
+
+
+def load_chunks(input_file: str,
+                config: Dict[str, Any],
+                output_dir: Optional[Path] = None,
+                previous_file: Optional[str] = None,
+                full: bool = False) -> Tuple[Dict[str, Any], Iterable[Dict[str, Any]]]:
+    """
+    Lê os chunks de um .chunks.jsonl ou divide um arquivo de texto
+
+    Para arquivos de texto com "output_dir", o texto e os chunks ficam
+    salvos nesse diretório. Na execução seguinte, a versão revisada é
+    comparada com a anterior (ou com "previous_file") e só os chunks
+    afetados mudam; os demais mantêm o texto e reaproveitam os resumos.
+
+    Returns:
+        (cabeçalho, chunks)
+    """
+    from chunker import iter_chunks, read_chunks_file, write_chunks_file
+
+    if strip_compression(input_file).endswith(".jsonl"):
+        return read_chunks_file(input_file)
+
+    processing = config.get("processing_config", {})
+    chunk_size = processing.get("chunk_size", 2000)
+    chunk_overlap = processing.get("chunk_overlap", 200)
+    header = {
+        "metadata": {"title": Path(strip_compression(input_file)).stem, "author": "Unknown"},
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+
+    with open_text(input_file, errors='ignore') as f:
+        text = f.read()
+
+    if output_dir is None:
+        return header, list(iter_chunks(text.split('\n'), chunk_size, chunk_overlap))
+
+    compression = config.get("storage", {}).get("compression")
+    snapshot_file = with_compression(str(output_dir / "fonte.md"), compression)
+    chunks_file = with_compression(str(output_dir / "chunks.jsonl"), compression)
+    old_text = None
+    old_chunks = None
+    if not full:
+        saved_snapshot = find_existing(snapshot_file)
+        saved_chunks_file = find_existing(chunks_file)
+        if previous_file:
+            with open_text(previous_file, errors='ignore') as f:
+                old_text = f.read()
+        elif saved_snapshot and saved_chunks_file:
+            with open_text(saved_snapshot) as f:
+                old_text = f.read()
+            old_header, saved_chunks = read_chunks_file(saved_chunks_file)
+            with saved_chunks:
+                if (old_header.get("chunk_size"), old_header.get("chunk_overlap")) == (chunk_size, chunk_overlap):
+                    old_chunks = list(saved_chunks)
+        else:
+            # O diretório vem do nome do arquivo: uma revisão salva com outro
+            # nome não encontra o snapshot e seria cobrada por inteiro
+            hint = "".join(f"\n  --previous {path}" for path in recent_snapshots(output_dir))
+            logger.warning(
+                f"Nenhuma versão anterior em {output_dir}: todos os chunks serão resumidos. "
+                f"Se {Path(input_file).name} revisa uma transcrição salva com outro nome, "
+                f"informe a versão anterior com --previous" + (f"; snapshots recentes:{hint}" if hint else "")
+            )
+
+    if old_text is not None:
+        from incremental import incremental_chunks
+
+        if old_chunks is None:
+            old_chunks = list(iter_chunks(old_text.split('\n'), chunk_size, chunk_overlap))
+        chunks, stats = incremental_chunks(old_text, text, old_chunks, chunk_size, chunk_overlap)
+        logger.info(
+            f"Modo incremental: {stats['changed_paragraphs']} parágrafos alterados, "
+            f"{stats['chunks_changed']} de {stats['chunks']} chunks afetados"
+        )
+    else:
+        chunks = list(iter_chunks(text.split('\n'), chunk_size, chunk_overlap))
+
+    write_chunks_file(chunks_file, header, chunks)
+    with open_text(snapshot_file, 'w') as f:
+        f.write(text)
+    return header, chunks
+
+
+def output_directory(config: Dict[str, Any], input_file: str) -> Path:
+    """Diretório de saída conforme storage.output_directory/organize_by_book"""
+    storage = config.get("storage", {})
+    base = Path(storage.get("output_directory", "./output")).expanduser()
+    stem = Path(input_file).name.split('.')[0]
+    return base / stem if storage.get("organize_by_book", True) else base
+
+
+def main():
+    """Interface de linha de comando"""
+    import argparse
+    from dispatcher import MessagesClient, DEFAULT_BASE_URL
+    from summary_cache import SummaryCache
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Gera o resumo progressivo (capítulos, partes e livro) via map-reduce"
+    )
+    parser.add_argument(
+        "input",
+        help="Arquivo .chunks.jsonl ou texto/transcrição (.txt, .md)"
+    )
+    parser.add_argument(
+        "--config",
+        default=str(Path(__file__).parent.parent / "configuracoes" / "config.json"),
+        help="Arquivo de configuração do agente"
+    )
+    parser.add_argument(
+        "--system-prompt",
+        default=str(Path(__file__).parent.parent / "prompts" / "system_prompt.md"),
+        help="Arquivo com o system prompt"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=os.environ.get("ANTHROPIC_BASE_URL", DEFAULT_BASE_URL),
+        help="URL base da API"
+    )
+    parser.add_argument(
+        "-o", "--output-dir",
+        help="Diretório de saída (padrão: storage.output_directory)"
+    )
+    parser.add_argument(
+        "--previous",
+        help=("Versão anterior da transcrição (padrão: a última processada no diretório de saída, "
+              "que depende do nome do arquivo; use ao revisar com outro nome)")
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Refaz todos os chunks, sem comparar com a versão anterior"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignora o cache de resumos"
+    )
+
+    args = parser.parse_args()
+
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        parser.error("Defina a variável de ambiente ANTHROPIC_API_KEY")
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    system_prompt = None
+    if args.system_prompt and Path(args.system_prompt).exists():
+        system_prompt = Path(args.system_prompt).read_text(encoding='utf-8')
+
+    output_dir = Path(args.output_dir) if args.output_dir else output_directory(config, args.input)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    cache = None if args.no_cache else SummaryCache.from_config(config)
+    dispatcher = SummaryDispatcher(
+        config, MessagesClient(api_key, args.base_url), system_prompt, cache
+    )
+    manifest_file = with_compression(
+        str(output_dir / "intermediarios.json"),
+        config.get("storage", {}).get("compression")
+    )
+    pipeline = SummaryPipeline(config, dispatcher, manifest_file)
+    header, chunks = load_chunks(args.input, config, output_dir, args.previous, args.full)
+
+    try:
+        result = asyncio.run(pipeline.run(header, chunks))
+    except PipelineError as e:
+        print(f"❌ {e}; rode novamente para retomar de onde parou")
+        raise SystemExit(1)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    with open(output_dir / "resumo_progressivo.json", 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    (output_dir / "resumo_progressivo.md").write_text(render_markdown(result), encoding='utf-8')
+
+    stats = result["stats"]
+    print(f"\n✅ {stats['chunks']} chunks, {stats['chapters']} capítulos, {stats['parts']} partes")
+    print(f"📨 {stats['requests_sent']} requisições enviadas, {stats['summaries_reused']} reaproveitadas")
+    print(f"📁 Resumo salvo em: {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
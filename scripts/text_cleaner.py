@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Limpeza de Texto Extraído
+Normalização linha a linha, em streaming, do texto convertido dos livros
+"""
+
+import re
+from typing import Iterable, Iterator, TextIO
+
+# Sequências de espaço/tab que mudam ao virar um único espaço
+# (um espaço isolado já está normalizado e não precisa de substituição)
+SPACES_RE = re.compile(r'\t[ \t]*| [ \t]+')
+PAGE_NUMBER_RE = re.compile(r'\s*\d+\s*$')
+CONTROL_CHARS_RE = re.compile('[\x00-\x09\x0b-\x1f]')
+
+# Remove caracteres de controle, preservando apenas a quebra de linha
+CONTROL_CHARS = dict.fromkeys(code for code in range(32) if code != 10)
+
+
+def iter_text_lines(text: str) -> Iterator[str]:
+    """Gera as linhas de um texto (sem o "\\n") sem criar uma lista"""
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_file_lines(f: TextIO) -> Iterator[str]:
+    """Gera as linhas de um arquivo como text.split('\\n') geraria"""
+    line = None
+    for line in f:
+        yield line[:-1] if line.endswith('\n') else line
+    # split() produz uma linha vazia final após o último "\n"
+    if line is None or line.endswith('\n'):
+        yield ''
+
+
+def _collapse_blank_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Reduz sequências de 3+ quebras de linha a 2 (uma linha em branco)"""
+    pending = 0
+    seen_text = False
+
+    for line in lines:
+        if not line:
+            pending += 1
+            continue
+        if pending:
+            # Entre textos, n linhas vazias vêm de n+1 quebras; no início,
+            # de n quebras
+            keep = 1 if seen_text else min(pending, 2)
+            for _ in range(keep):
+                yield ''
+            pending = 0
+        seen_text = True
+        yield line
+
+    if pending:
+        keep = min(pending, 2) if seen_text else min(pending, 3)
+        for _ in range(keep):
+            yield ''
+
+
+def _normalize_line(line: str) -> str:
+    """Normaliza espaços e remove caracteres de controle de uma linha"""
+    if '\t' in line or '  ' in line:
+        line = SPACES_RE.sub(' ', line)
+    if CONTROL_CHARS_RE.search(line):
+        line = line.translate(CONTROL_CHARS)
+    return line
+
+
+def iter_clean_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Limpa o texto linha a linha
+
+    Remove quebras de linha excessivas, espaços repetidos, caracteres de
+    controle, números de página isolados e linhas curtas repetidas.
+
+    Args:
+        lines: Linhas do texto bruto, sem "\\n"
+
+    Yields:
+        Linhas limpas
+    """
+    normalized = map(_normalize_line, _collapse_blank_lines(lines))
+
+    line = next(normalized, None)
+    if line is None:
+        return
+
+    previous = None
+    for following in normalized:
+        stripped = line.strip()
+        # Pular números de página e linhas muito curtas repetitivas
+        if not PAGE_NUMBER_RE.match(line) and not (len(stripped) < 5 and previous == stripped):
+            yield line
+        previous = stripped
+        line = following
+
+    # A última linha só é descartada se for número de página
+    if not PAGE_NUMBER_RE.match(line):
+        yield line
+
+
+def clean_text(text: str) -> str:
+    """Limpa e normaliza texto extraído"""
+    return '\n'.join(iter_clean_lines(iter_text_lines(text)))